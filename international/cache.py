@@ -0,0 +1,151 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import translation
+from django.utils.cache import (
+    cc_delim_re, get_max_age, patch_cache_control, patch_response_headers, patch_vary_headers,
+)
+from django.utils.decorators import decorator_from_middleware_with_args
+from django.utils.deprecation import MiddlewareMixin
+
+from .current import get_current_country_site
+
+# Vary headers replaced by the country site and language in the cache key,
+# responses varying on other headers are not cached
+COUNTRY_CACHE_VARY_HEADERS = ("cookie", "accept-language", "host")
+
+
+def get_country_cache_vary(request=None):
+    """
+    Return (country code, language code) that cached content for this
+    request is varied on
+    """
+
+    country_site = getattr(request, "country_site", None) or get_current_country_site()
+    country_code = country_site.country_code if country_site is not None else ""
+    language = getattr(request, "LANGUAGE_CODE", None) or translation.get_language()
+    return country_code, language
+
+
+def get_country_cache_key(request, key_prefix=None):
+    """
+    Return the page cache key for request: the absolute url, country code and
+    language. Other request cookies and headers are not part of the key.
+    """
+
+    if key_prefix is None:
+        key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+
+    country_code, language = get_country_cache_vary(request)
+    url = hashlib.md5(request.build_absolute_uri().encode("ascii")).hexdigest()
+    return "international.cache_page.%s.%s.%s.%s" % (key_prefix, country_code, language, url)
+
+
+class CountryCacheMiddleware(MiddlewareMixin):
+    """
+    Page cache keyed on country site and language instead of the Vary headers
+    (e.g. Cookie) of the response, so all visitors of a country site share the
+    cached pages.
+
+    Requests with a session cookie (see COUNTRY_CACHE_BYPASS_COOKIES), an
+    authenticated user or an Authorization header skip the cache. Responses
+    that set cookies, use the CSRF token or vary on other headers than Cookie,
+    Accept-Language and Host are not cached.
+
+    Cached responses are sent as Cache-Control: private with Vary: Cookie, so
+    shared caches (CDNs, proxies) don't serve one country's page to others.
+
+    Add it after InternationalSiteMiddleware (and LocaleMiddleware) in MIDDLEWARE,
+    or use the cache_page_per_country view decorator.
+    """
+
+    def __init__(self, get_response, page_timeout=None, cache_alias=None, key_prefix=None):
+        super().__init__(get_response)
+        self.cache_timeout = settings.CACHE_MIDDLEWARE_SECONDS
+        self.page_timeout = page_timeout
+        self.cache_alias = cache_alias or settings.CACHE_MIDDLEWARE_ALIAS
+        self.key_prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX if key_prefix is None else key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _bypass_cache(self, request):
+        if request.method not in ("GET", "HEAD") or request.META.get("HTTP_AUTHORIZATION"):
+            return True
+
+        bypass_cookies = getattr(settings, "COUNTRY_CACHE_BYPASS_COOKIES", (settings.SESSION_COOKIE_NAME,))
+        if any(cookie in request.COOKIES for cookie in bypass_cookies):
+            return True
+
+        user = getattr(request, "user", None)
+        return user is not None and user.is_authenticated
+
+    def _is_vary_supported(self, response):
+        if not response.has_header("Vary"):
+            return True
+
+        vary = cc_delim_re.split(response["Vary"])
+        return all(header.lower() in COUNTRY_CACHE_VARY_HEADERS for header in vary if header)
+
+    def process_request(self, request):
+        if self._bypass_cache(request):
+            request._country_cache_update = False
+            return None
+
+        response = self.cache.get(get_country_cache_key(request, self.key_prefix))
+        request._country_cache_update = response is None
+        return response
+
+    def process_response(self, request, response):
+        if not getattr(request, "_country_cache_update", False):
+            return response
+
+        if response.streaming or response.status_code != 200:
+            return response
+
+        # Cookies and CSRF tokens are visitor specific, so would leak to other visitors
+        if response.cookies or request.META.get("CSRF_COOKIE_USED") or request.META.get("CSRF_COOKIE_NEEDS_UPDATE"):
+            return response
+
+        cache_control = response.get("Cache-Control", "").lower()
+        if any(directive in cache_control for directive in ("private", "no-cache", "no-store")):
+            return response
+
+        if not self._is_vary_supported(response):
+            return response
+
+        timeout = self.page_timeout
+        if timeout is None:
+            timeout = get_max_age(response)
+            if timeout is None:
+                timeout = self.cache_timeout
+        if not timeout:
+            return response
+
+        patch_response_headers(response, timeout)
+
+        # The page differs per country site, which downstream caches can't see
+        # from the request, so only the visitor's browser may cache it
+        patch_cache_control(response, private=True)
+        patch_vary_headers(response, ["Cookie"])
+
+        cache_key = get_country_cache_key(request, self.key_prefix)
+        if hasattr(response, "render") and callable(response.render):
+            response.add_post_render_callback(lambda r: self.cache.set(cache_key, r, timeout))
+        else:
+            self.cache.set(cache_key, response, timeout)
+
+        return response
+
+
+def cache_page_per_country(timeout, *, cache=None, key_prefix=None):
+    """
+    View decorator like django.views.decorators.cache.cache_page, caching one
+    version of the page per country site and language
+    """
+
+    return decorator_from_middleware_with_args(CountryCacheMiddleware)(
+        page_timeout=timeout, cache_alias=cache, key_prefix=key_prefix,
+    )
@@ -0,0 +1,45 @@
+from collections import namedtuple
+
+from .models import CountrySite
+
+CountrySiteSwitch = namedtuple(
+    "CountrySiteSwitch",
+    ["country_code", "name", "domain", "default_language", "language_name", "icon", "switch_url"],
+)
+
+# (active sites tuple, switches built from it)
+_SWITCHES = (None, ())
+
+
+def get_country_site_switches():
+    """
+    Return tuple of CountrySiteSwitch for all active country sites, rebuilt
+    only when the cached active sites change
+    """
+
+    global _SWITCHES
+
+    sites = CountrySite.objects.get_active_sites()
+    if _SWITCHES[0] is not sites:
+        _SWITCHES = (sites, tuple(
+            CountrySiteSwitch(
+                country_code=site.country_code,
+                name=site.name,
+                domain=site.domain,
+                default_language=site.default_language,
+                language_name=site.get_default_language_display(),
+                icon=site.get_icon(),
+                switch_url=site.get_country_site_switch_url(),
+            )
+            for site in sites
+        ))
+
+    return _SWITCHES[1]
+
+
+def country_sites(request):
+    """
+    Add the active country sites for a country switcher to the template context
+    """
+
+    return {"country_sites": get_country_site_switches()}
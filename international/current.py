@@ -0,0 +1,28 @@
+from contextvars import ContextVar
+
+# CountrySite of the request being handled, set by InternationalSiteMiddleware
+_current_country_site = ContextVar("international_country_site", default=None)
+
+
+def get_current_country_site():
+    """
+    Return the CountrySite of the current request, None outside of a request
+    """
+
+    return _current_country_site.get()
+
+
+def set_current_country_site(country_site):
+    """
+    Set the CountrySite of the current request, returns a token for reset_current_country_site
+    """
+
+    return _current_country_site.set(country_site)
+
+
+def reset_current_country_site(token):
+    try:
+        _current_country_site.reset(token)
+    except ValueError:
+        # Token was created in another context (e.g. sync/async switch)
+        _current_country_site.set(None)
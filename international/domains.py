@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.http.request import split_domain_port
+
+WILDCARD = "*"
+
+# Built on first use, cleared when a country site is saved or deleted
+_DOMAIN_TRIE = None
+
+
+class DomainTrie:
+    """
+    Map domain names to country codes in a trie of reversed domain labels
+    (de -> example -> shop), so a host is resolved in one pass over its labels.
+    A "*" label matches one or more subdomain labels, the most specific
+    match wins.
+    """
+
+    def __init__(self):
+        self.root = {}
+        # Exact "host:port" entries, matched before the domain labels
+        self.hosts = {}
+
+    def add(self, domain, country_code):
+        node = self.root
+        for label in reversed(domain.lower().rstrip(".").split(".")):
+            node = node.setdefault(label, {})
+        # Country code of a node is stored under None, which can't be a label
+        node[None] = country_code
+
+    def resolve(self, domain):
+        """
+        Return country code for domain (without port), None if not found
+        """
+
+        node = self.root
+        match = None
+        for label in reversed(domain.split(".")):
+            wildcard = node.get(WILDCARD)
+            if wildcard is not None and None in wildcard:
+                match = wildcard[None]
+
+            node = node.get(label)
+            if node is None:
+                return match
+
+        return node.get(None, match)
+
+
+def build_domain_trie():
+    """
+    Build trie from the domains of active country sites and settings.UNIQUE_DOMAINS.
+
+    Country site domains also match their subdomains, unless the domain is
+    shared by several country sites or listed in settings.GENERIC_DOMAINS, in
+    which case the site is detected from url parameter, cookie or location.
+    Entries in UNIQUE_DOMAINS (e.g. "example.nl" or "*.example.nl") take
+    precedence over country site domains. Entries with a port (e.g.
+    "localhost:8001") only match requests for that host and port.
+    """
+
+    from .models import CountrySite
+
+    generic = {domain.lower() for domain in getattr(settings, "GENERIC_DOMAINS", ())}
+
+    site_domains = {}
+    for site in CountrySite.objects.get_active_sites():
+        domain = split_domain_port(site.domain)[0]
+        if domain:
+            site_domains.setdefault(domain, set()).add(site.country_code)
+
+    trie = DomainTrie()
+    for domain, country_codes in site_domains.items():
+        if len(country_codes) == 1 and domain not in generic:
+            country_code = country_codes.pop()
+            trie.add(domain, country_code)
+            trie.add(WILDCARD + "." + domain, country_code)
+
+    for domain, country_code in getattr(settings, "UNIQUE_DOMAINS", {}).items():
+        if split_domain_port(domain)[1]:
+            trie.hosts[domain.lower()] = country_code.upper()
+        else:
+            trie.add(domain, country_code.upper())
+
+    return trie
+
+
+def get_domain_trie():
+    global _DOMAIN_TRIE
+
+    if _DOMAIN_TRIE is None:
+        _DOMAIN_TRIE = build_domain_trie()
+
+    return _DOMAIN_TRIE
+
+
+def clear_domain_trie(**kwargs):
+    """
+    Clear the domain trie, it is rebuilt on next use
+    """
+
+    global _DOMAIN_TRIE
+    _DOMAIN_TRIE = None
+
+
+def get_country_code_for_host(host):
+    """
+    Return country code for a request host (with or without port), None if
+    the host does not identify a country site
+    """
+
+    trie = get_domain_trie()
+    if trie.hosts:
+        country_code = trie.hosts.get(host.lower())
+        if country_code:
+            return country_code
+
+    domain = split_domain_port(host)[0]
+    if not domain:
+        return None
+
+    return trie.resolve(domain)
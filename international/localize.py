@@ -1,39 +1,494 @@
-from django.shortcuts import render
+import bisect
+import ipaddress
+import mmap
+import os
+import re
+import socket
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from functools import lru_cache
+
 from django.contrib.gis.geoip2 import GeoIP2
-from django.conf import settings 
+from django.conf import settings
+
+# Country codes set by edge proxies/CDNs for unknown or anonymous visitors
+# (e.g. Cloudflare uses "XX" for unknown and "T1" for Tor)
+UNKNOWN_COUNTRY_CODES = ("XX", "T1", "A1", "A2", "O1")
+
+COUNTRY_CODE_RE = re.compile(r"^[A-Z]{2}$")
+
+# Detected country codes that differ from the country site codes
+COUNTRY_CODE_ALIASES = {"GB": "UK"}
+
+# Marker file in settings.GEOIP_PATH rewritten by check_and_update_geoip2
+# after every database update, running processes reload when it changes
+GEOIP_GENERATION_FILE = "GeoLite2-Country.generation"
+
+# Seconds between checks of the generation marker file
+GEOIP_RELOAD_INTERVAL = 60
+
+# Range table compiled from the GeoIP2 database for settings.GEOIP_ENGINE = "rangetable"
+RANGE_TABLE_FILE = "GeoLite2-Country.ranges"
+
+IPV4_COMPATIBLE_PREFIX = bytes(12)
+IPV4_MAPPED_PREFIX = bytes(10) + b"\xff\xff"
+SIXTOFOUR_PREFIX = b"\x20\x02"
+
+# Open readers per engine: name -> [reader, generation, last check]
+_READERS = {}
+
+
+def parse_ip(ip, embedded_ipv4=True):
+    """
+    Return (IP version, key) for an IP address string, with an int key for
+    IPv4 and 16 bytes for IPv6, or (None, None) when it is not an IP address.
+
+    IPv4 mapped IPv6 addresses are returned as IPv4, and with embedded_ipv4
+    also IPv4 compatible and 6to4 addresses (as the GeoIP2 database does).
+    """
+
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError):
+        pass
+
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    except (OSError, TypeError):
+        return None, None
+
+    if packed[:12] == IPV4_MAPPED_PREFIX or (embedded_ipv4 and packed[:12] == IPV4_COMPATIBLE_PREFIX):
+        return 4, int.from_bytes(packed[12:], "big")
+    if embedded_ipv4 and packed[:2] == SIXTOFOUR_PREFIX:
+        return 4, int.from_bytes(packed[2:6], "big")
+
+    return 6, packed
+
+
+class NetworkMatcher:
+    """
+    Set of CIDR networks compiled once into merged, sorted address ranges,
+    so an IP address is matched with a binary search
+    """
+
+    def __init__(self, networks):
+        ranges = {4: [], 6: []}
+        for network in networks:
+            network = ipaddress.ip_network(network, strict=False)
+            if network.version == 4:
+                ranges[4].append((int(network.network_address), int(network.broadcast_address)))
+            else:
+                ranges[6].append((network.network_address.packed, network.broadcast_address.packed))
+
+        self.starts = {}
+        self.ends = {}
+        for version, items in ranges.items():
+            merged = []
+            for start, end in sorted(items):
+                if merged and start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.starts[version] = [start for start, end in merged]
+            self.ends[version] = [end for start, end in merged]
+
+    def __contains__(self, ip):
+        version, key = parse_ip(ip, embedded_ipv4=False)
+        if version is None:
+            return False
+
+        i = bisect.bisect_right(self.starts[version], key) - 1
+        return i >= 0 and key <= self.ends[version][i]
+
+    def __bool__(self):
+        return bool(self.starts[4] or self.starts[6])
+
+
+@lru_cache(maxsize=None)
+def get_network_matcher(networks):
+    """
+    Return NetworkMatcher for a tuple of CIDR networks, compiled once
+    """
+
+    return NetworkMatcher(networks)
+
+
+def get_trusted_proxies():
+    """
+    NetworkMatcher of settings.TRUSTED_PROXIES, the CIDR networks of the
+    proxies/CDN in front of the application
+    """
+
+    return get_network_matcher(tuple(getattr(settings, "TRUSTED_PROXIES", ())))
+
+
+def is_trusted_proxy_request(request):
+    """
+    Check if the request was received from a trusted proxy
+    """
+
+    return request.META.get("REMOTE_ADDR", "") in get_trusted_proxies()
+
 
 def visitor_ip_address(request):
     """
     Parse visitor public IP adress from HTTP headers
+
+    With settings.TRUSTED_PROXIES, X-Forwarded-For is only used for requests
+    from a trusted proxy, and the visitor is the last address before the
+    trusted proxies. Without it, the first address is used.
     """
 
     x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    remote_addr = request.META.get("REMOTE_ADDR")
+
+    if not x_forwarded_for:
+        return remote_addr
+
+    hops = [hop.strip() for hop in x_forwarded_for.split(',')]
+
+    trusted_proxies = get_trusted_proxies()
+    if not trusted_proxies:
+        return hops[0]
+
+    if remote_addr not in trusted_proxies:
+        return remote_addr
+
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+
+    return hops[0]
+
+
+def is_country_code(value):
+    """
+    Check if value looks like an (upper case) two letter country code
+    """
+
+    return bool(value) and COUNTRY_CODE_RE.match(value) is not None
+
+
+def normalize_country_code(country_code):
+    """
+    Map a detected country code to the code used by the country sites,
+    settings.COUNTRY_CODE_ALIASES (default {"GB": "UK"})
+    """
+
+    if not country_code:
+        return None
+
+    return getattr(settings, "COUNTRY_CODE_ALIASES", COUNTRY_CODE_ALIASES).get(country_code, country_code)
+
+
+def ip_in_networks(ip, networks):
+    """
+    Check if an IP address is part of any of the given CIDR networks
+    """
+
+    return ip in get_network_matcher(tuple(networks))
+
+
+def get_country_from_header(request):
+    """
+    Return the visitor country set by an edge proxy/CDN in one of the
+    request headers configured in settings.COUNTRY_HEADERS (e.g. HTTP_CF_IPCOUNTRY),
+    only for requests received from settings.TRUSTED_PROXIES
+    """
+
+    headers = getattr(settings, "COUNTRY_HEADERS", ())
+    if not headers or not is_trusted_proxy_request(request):
+        return None
+
+    for header in headers:
+        country_code = request.META.get(header, "").strip().upper()
+        if is_country_code(country_code) and country_code not in UNKNOWN_COUNTRY_CODES:
+            return normalize_country_code(country_code)
+
+    return None
+
+
+def get_geoip_generation():
+    """
+    Return the contents of the generation marker file, None when there is none
+    """
+
+    try:
+        with open(os.path.join(settings.GEOIP_PATH, GEOIP_GENERATION_FILE)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
 
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
+
+class _Keys:
+    """
+    Sequence view of fixed width big-endian keys in a buffer, for bisect
+    """
+
+    def __init__(self, buffer, offset, width, length):
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        start = self.offset + i * self.width
+        return self.buffer[start:start + self.width]
+
+
+class RangeTable:
+    """
+    Compact country lookup table of sorted, non-overlapping IP ranges
+    compiled from a GeoIP2 country database.
+
+    The file is memory-mapped read-only, so all worker processes share the
+    same pages. Layout (little-endian header, IPv4 keys as little-endian
+    uint32, IPv6 keys as 16 byte big-endian):
+
+        header    magic, number of countries, IPv4 ranges, IPv6 ranges
+        countries two byte country codes
+        IPv4      range starts, range ends, country indexes (uint16)
+        IPv6      range starts, range ends, country indexes (uint16)
+    """
+
+    MAGIC = b"INTLRNG1"
+    HEADER = struct.Struct("<8sIII")
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, n_countries, n4, n6 = self.HEADER.unpack_from(self.buffer)
+        if magic != self.MAGIC:
+            raise ValueError("{0} is not a country range table".format(path))
+
+        offset = self.HEADER.size
+        countries = self.buffer[offset:offset + 2 * n_countries].decode("ascii")
+        self.countries = [countries[i:i + 2] for i in range(0, len(countries), 2)]
+        offset += 2 * n_countries
+
+        self.v4_starts, offset = self._array_view(offset, n4, "I")
+        self.v4_ends, offset = self._array_view(offset, n4, "I")
+        self.v4_countries, offset = self._array_view(offset, n4, "H")
+
+        self.v6_starts = _Keys(self.buffer, offset, 16, n6)
+        self.v6_ends = _Keys(self.buffer, offset + 16 * n6, 16, n6)
+        self.v6_countries, offset = self._array_view(offset + 32 * n6, n6, "H")
+
+    def _array_view(self, offset, length, typecode):
+        """
+        Return a zero-copy view of little-endian unsigned integers in the buffer
+        (a copy on big-endian machines) and the offset after it
+        """
+
+        end = offset + array(typecode).itemsize * length
+        view = memoryview(self.buffer)[offset:end]
+        if sys.byteorder == "little":
+            view = view.cast(typecode)
+        else:
+            view = array(typecode, view)
+            view.byteswap()
+        return view, end
+
+    def _find(self, version, key):
+        if version == 4:
+            starts, ends, countries = self.v4_starts, self.v4_ends, self.v4_countries
+        else:
+            starts, ends, countries = self.v6_starts, self.v6_ends, self.v6_countries
+
+        i = bisect.bisect_right(starts, key) - 1
+        if i >= 0 and key <= ends[i]:
+            return self.countries[countries[i]]
+        return None
+
+    def lookup(self, ip):
+        """
+        Return country code of an IP address, None if unknown
+        """
+
+        version, key = parse_ip(ip)
+        if version is None:
+            return None
+        return self._find(version, key)
+
+    def lookup_many(self, ips):
+        """
+        Return list of country codes (or None) for a list of IP addresses
+        """
+
+        find = self._find
+        return [find(version, key) if version else None for version, key in map(parse_ip, ips)]
+
+    @classmethod
+    def compile(cls, database_path, path):
+        """
+        Compile a GeoIP2 (or GeoLite2) country database to a range table file
+        """
+
+        import maxminddb
+
+        countries = {}
+        ranges = {4: [], 6: []}
+        ipv4_aliases = [ipaddress.ip_network(n) for n in ("::/96", "::ffff:0:0/96", "2002::/16")]
+
+        with maxminddb.open_database(database_path) as reader:
+            for network, record in reader:
+                country_code = ((record or {}).get("country") or {}).get("iso_code")
+                if not country_code:
+                    continue
+
+                # IPv4 space is also reachable through IPv6 aliases, which are
+                # looked up as IPv4 instead
+                if network.version == 6 and any(network.subnet_of(alias) for alias in ipv4_aliases):
+                    continue
+
+                index = countries.setdefault(country_code, len(countries))
+                ranges[network.version].append(
+                    (int(network.network_address), int(network.broadcast_address), index)
+                )
+
+        # Merge adjacent ranges of the same country
+        for version in (4, 6):
+            merged = []
+            for start, end, index in sorted(ranges[version]):
+                if merged and merged[-1][2] == index and merged[-1][1] + 1 == start:
+                    merged[-1][1] = end
+                else:
+                    merged.append([start, end, index])
+            ranges[version] = merged
+
+        v4, v6 = ranges[4], ranges[6]
+        country_codes = sorted(countries, key=countries.get)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, len(country_codes), len(v4), len(v6)))
+                f.write("".join(country_codes).encode("ascii"))
+                for column in (0, 1):
+                    f.write(struct.pack("<{0}I".format(len(v4)), *(r[column] for r in v4)))
+                f.write(struct.pack("<{0}H".format(len(v4)), *(r[2] for r in v4)))
+                for column in (0, 1):
+                    f.write(b"".join(r[column].to_bytes(16, "big") for r in v6))
+                f.write(struct.pack("<{0}H".format(len(v6)), *(r[2] for r in v6)))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        return len(v4), len(v6)
+
+
+def _get_reader(engine, open_reader):
+    """
+    Return reader for engine, opened once per process and reopened when the
+    database has been updated by check_and_update_geoip2
+    """
+
+    reader = _READERS.get(engine)
+
+    now = time.monotonic()
+    if reader is not None and now - reader[2] < getattr(settings, "GEOIP_RELOAD_INTERVAL", GEOIP_RELOAD_INTERVAL):
+        return reader[0]
+
+    generation = get_geoip_generation()
+
+    if reader is None or generation != reader[1]:
+        reader = [open_reader(), generation, now]
+        _READERS[engine] = reader
     else:
-        ip = request.META.get("REMOTE_ADDR")
-    return ip
+        reader[2] = now
 
+    return reader[0]
 
-def get_country_from_ip(request):
+
+def recheck_geoip_generation():
     """
-    Check GeoIP2 library for visitor country based on IP
+    Check the generation marker file on next use of the readers, e.g. after
+    the process was forked from a preloaded parent
     """
 
-    if not getattr(settings, "GEOIP_PATH", False):
+    for reader in _READERS.values():
+        reader[2] = 0
+
+
+def get_geoip():
+    """
+    Return GeoIP2 reader
+    """
+
+    return _get_reader("geoip2", GeoIP2)
+
+
+def get_range_table_path():
+    return getattr(settings, "GEOIP_RANGE_TABLE", os.path.join(settings.GEOIP_PATH, RANGE_TABLE_FILE))
+
+
+def get_range_table():
+    """
+    Return memory-mapped RangeTable
+    """
+
+    return _get_reader("rangetable", lambda: RangeTable(get_range_table_path()))
+
+
+def use_range_table():
+    return getattr(settings, "GEOIP_ENGINE", "geoip2") == "rangetable"
+
+
+def get_country_from_ip_address(ip):
+    """
+    Check GeoIP2 library for the country of a single IP address
+    """
+
+    if not getattr(settings, "GEOIP_PATH", False) or not ip:
+        return None
+
+    if use_range_table():
+        try:
+            return normalize_country_code(get_range_table().lookup(ip))
+        except Exception:
+            return None
+
+    try:
+        country = get_geoip().country(ip)
+    except Exception:
         return None
 
-    IP = visitor_ip_address(request)
+    return normalize_country_code(country.get("country_code"))
+
+
+def get_countries_from_ip_addresses(ips):
+    """
+    Check GeoIP2 library for the countries of multiple IP addresses,
+    returns a dict of IP address -> country code (or None)
+    """
+
+    if getattr(settings, "GEOIP_PATH", False) and use_range_table():
+        ips = list(ips)
+        try:
+            countries = get_range_table().lookup_many(ips)
+        except Exception:
+            countries = [None] * len(ips)
+        return dict(zip(ips, map(normalize_country_code, countries)))
+
+    return {ip: get_country_from_ip_address(ip) for ip in ips}
+
+
+def get_country_from_ip(request):
+    """
+    Check trusted edge/CDN header or else GeoIP2 library for visitor country based on IP
+    """
 
     # Example
     # IP = "143.177.174.48"
-    
-    g = GeoIP2()
 
-    try:
-        country = g.country(IP)
-    except:
-        return None
-    
-    return country.get("country_code")
\ No newline at end of file
+    return get_country_from_header(request) or get_country_from_ip_address(visitor_ip_address(request))
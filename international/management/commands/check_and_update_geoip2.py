@@ -1,98 +1,186 @@
 import os
 import shutil
-import requests
+import hashlib
+import tempfile
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
-from django.core.management.base import BaseCommand
-from django.contrib.gis.geoip2 import GeoIP2
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 
 import tarfile
 
-PERMALINK = "https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-Country&license_key={0}&suffix=tar.gz"
+from international.localize import GEOIP_GENERATION_FILE, RangeTable, get_range_table_path, use_range_table
+
+# Default download location, {suffix} is "tar.gz" for the database archive
+# and "tar.gz.sha256" for its checksum file
+PERMALINK = "https://download.maxmind.com/app/geoip_download?edition_id=GeoLite2-Country&license_key={license_key}&suffix={suffix}"
+
+DATABASE_NAME = "GeoLite2-Country.mmdb"
+
+CHUNK_SIZE = 64 * 1024
 
 class Command(BaseCommand):
     help = "Check for updates of the GeoIP2 library and download if necessary"
 
-    def handle(self, *args, **options):
-        self.cmd = __file__.split("/")[-1].replace(".py", "")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help="Database archive url (http(s)://, file:// or local path), defaults to settings.GEOIP_DOWNLOAD_URL",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Download and install the database even if it is up to date",
+        )
 
+    def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Successfully starting check for GeoIP2 library updates'))
 
-        print(getattr(settings, "GEOIP_LICENSE",""))
+        url = options["url"] or getattr(settings, "GEOIP_DOWNLOAD_URL", PERMALINK)
 
-        if not getattr(settings, "GEOIP_LICENSE",""):
+        if "{license_key}" in url and not getattr(settings, "GEOIP_LICENSE", ""):
             self.stdout.write(self.style.ERROR('Add a MaxMind GeoIP license key to settings.py: GEOIP_LICENSE'))
             return
 
-        check = requests.head(PERMALINK.format(settings.GEOIP_LICENSE))
+        license_key = getattr(settings, "GEOIP_LICENSE", "")
+        archive_url = url.format(license_key=license_key, suffix="tar.gz")
+        if "{suffix}" in url:
+            checksum_url = url.format(license_key=license_key, suffix="tar.gz.sha256")
+        else:
+            checksum_url = archive_url + ".sha256"
+        checksum_url = getattr(settings, "GEOIP_CHECKSUM_URL", checksum_url)
 
-        latest_file = check.headers.get("Content-Disposition").split("filename=")[-1]
-        print("..latest file available for download is {0}".format(latest_file))
-
-        latest_file_dig = int(latest_file.split(".tar.gz")[0].split("_")[-1])
-        
-        print(check.headers)
         if not os.path.exists(settings.GEOIP_PATH):
             os.makedirs(settings.GEOIP_PATH)
 
-        # Check if file in geolite directory
-        dbs = 0
-        download = True
-        extract = False
-        for fname in os.listdir(settings.GEOIP_PATH):
-            if fname.endswith(".mmdb"):
-                dbs += 1
-            elif fname == latest_file:
-                self.stdout.write(self.style.SUCCESS('Current GeoIP2 database tar is the latest version available ({0})'.format(fname)))
-                download = False
-                break
-                    
-        if dbs == 0:
-            download = True
-
-
-        if download:
+        # MaxMind checksum file contents: "<sha256>  GeoLite2-Country_20210824.tar.gz"
+        checksum = read_url(checksum_url).decode().split()
+        if not checksum or len(checksum[0]) != 64:
+            raise CommandError("Invalid checksum file at {0}".format(urlparse(checksum_url).path))
 
-            r = requests.get(PERMALINK.format(settings.GEOIP_LICENSE))
-            fpath = settings.GEOIP_PATH + "/{0}".format(latest_file)
+        expected_digest = checksum[0].lower()
+        latest_file = checksum[1] if len(checksum) > 1 else os.path.basename(urlparse(archive_url).path)
+        generation = "{0} {1}".format(latest_file, expected_digest)
+        self.stdout.write("..latest file available for download is {0}".format(latest_file))
 
-            with open(fpath, 'wb') as f:
-                f.write(r.content)
-                print("..latest file available for download is {0}".format(latest_file))
-                self.stdout.write(self.style.SUCCESS('..Successfully downloaded latest GeoIP2 database tar to {0}'.format(settings.GEOIP_PATH + "/{0}".format(latest_file))))
+        database_path = os.path.join(settings.GEOIP_PATH, getattr(settings, "GEOIP_COUNTRY", DATABASE_NAME))
+        generation_path = os.path.join(settings.GEOIP_PATH, GEOIP_GENERATION_FILE)
 
+        if not options["force"] and os.path.exists(database_path) and read_file(generation_path) == generation:
+            self.stdout.write(self.style.SUCCESS('Current GeoIP2 database is the latest version available ({0})'.format(latest_file)))
 
-            tar = tarfile.open(fpath)
-            tar.extractall(settings.GEOIP_PATH) # specify which folder to extract to
-            tar.close()
-
-            extract = True
-
-
-        if extract :
-            # Move extracted db to geoip directory
-            dirname = latest_file.split(".tar")[0]
-            dirpath = "{0}/{1}".format(settings.GEOIP_PATH, dirname)
-            f = "{0}/{1}/GeoLite2-Country.mmdb".format(settings.GEOIP_PATH, dirname)
-            os.replace(f, "{0}/GeoLite2-Country.mmdb".format(settings.GEOIP_PATH))
-
-            # Clear up old extraction folder
-            if os.path.exists(dirpath):
-                for fname in os.listdir(dirpath):
-                    os.remove(os.path.join(dirpath,fname))
-                os.rmdir(dirpath)
-                print("...removed temp tar directory: {0}".format(dirpath))
-
-            # Clear up old tar files and subdirectories
-            for fname in os.listdir(settings.GEOIP_PATH):
-                if fname.endswith(".tar.gz") and not fname.startswith(latest_file):
-                    print("...removing old tar file: {0}".format(fname))
-                    os.remove(os.path.join(settings.GEOIP_PATH, fname))
-
-        
-
-        # {'Date': 'Thu, 26 Aug 2021 14:16:42 GMT', 'Content-Type': 'application/gzip', 'Content-Length': '3487359', 'Connection': 'keep-alive', 'CF-Ray': '684daded39b59cb1-AMS', 'Accept-Ranges': 'bytes', 'Cache-Control': 'private, max-age=0', 'Content-Disposition': 'attachment; filename=GeoLite2-Country_20210824.tar.gz', 'ETag': '"ecc8e32c1bc7b105fe13a62d4682c733"', 'Expires': 'Thu, 26 Aug 2021 14:16:42 GMT', 'Last-Modified': 'Mon, 23 Aug 2021 18:52:46 GMT', 'CF-Cache-Status': 'DYNAMIC', 'expect-ct': 'max-age=604800, report-uri="https://report-uri.cloudflare.com/cdn-cgi/beacon/expect-ct"', 'X-MaxMind-Worker': 'enabled', 'Vary': 'Accept-Encoding', 'Server': 'cloudflare'}
+            # E.g. GEOIP_ENGINE switched to "rangetable" after the database was installed
+            if use_range_table() and not os.path.exists(get_range_table_path()):
+                self.compile_range_table(database_path)
+            return
 
-        # g = GeoIP2()
-        # result = g.city('8.8.8.8')
-        # pprint(result)
+        archive = tempfile.NamedTemporaryFile(dir=settings.GEOIP_PATH, suffix=".tar.gz.part", delete=False)
+        try:
+            # Stream the archive to disk while computing its checksum
+            digest = hashlib.sha256()
+            with archive:
+                for chunk in iter_url(archive_url):
+                    digest.update(chunk)
+                    archive.write(chunk)
+
+            if digest.hexdigest() != expected_digest:
+                raise CommandError("Checksum mismatch for {0}: expected {1}, got {2}".format(
+                    latest_file, expected_digest, digest.hexdigest()))
+
+            self.stdout.write(self.style.SUCCESS('..Successfully downloaded and verified {0}'.format(latest_file)))
+
+            with tarfile.open(archive.name) as tar:
+                member = next((m for m in tar.getmembers() if m.isfile() and m.name.endswith(".mmdb")), None)
+                if member is None:
+                    raise CommandError("No .mmdb database found in {0}".format(latest_file))
+
+                # Extract next to the live database, then swap it in with an atomic rename
+                # so workers never read a partially written file
+                with tar.extractfile(member) as source:
+                    write_atomic(database_path, lambda f: shutil.copyfileobj(source, f, CHUNK_SIZE))
+        finally:
+            if os.path.exists(archive.name):
+                os.remove(archive.name)
+
+        if use_range_table():
+            self.compile_range_table(database_path)
+
+        # Signal running processes to reopen the database
+        write_atomic(generation_path, lambda f: f.write(generation.encode()))
+        self.stdout.write(self.style.SUCCESS('..Successfully installed GeoIP2 database {0}'.format(database_path)))
+
+        # Clear up tar files left by previous versions of this command
+        for fname in os.listdir(settings.GEOIP_PATH):
+            if fname.startswith("GeoLite2-Country_") and fname.endswith(".tar.gz"):
+                self.stdout.write("...removing old tar file: {0}".format(fname))
+                os.remove(os.path.join(settings.GEOIP_PATH, fname))
+
+    def compile_range_table(self, database_path):
+        RangeTable.compile(database_path, get_range_table_path())
+        self.stdout.write(self.style.SUCCESS('..Successfully compiled range table {0}'.format(get_range_table_path())))
+
+
+def url_to_path(url):
+    """
+    Return local file path for file:// urls and plain paths, None otherwise
+    """
+
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return url2pathname(parsed.path)
+    if not parsed.scheme or len(parsed.scheme) == 1:  # Plain (Windows) path
+        return url
+    return None
+
+
+def iter_url(url):
+    """
+    Yield the contents of url in chunks
+    """
+
+    path = url_to_path(url)
+
+    if path is not None:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                yield chunk
+        return
+
+    import requests
+
+    with requests.get(url, stream=True, timeout=60) as r:
+        if r.status_code != 200:
+            raise CommandError("Download of {0} failed with status {1}".format(urlparse(url).path, r.status_code))
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            yield chunk
+
+
+def read_url(url):
+    return b"".join(iter_url(url))
+
+
+def read_file(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def write_atomic(path, write):
+    """
+    Write a file through a temporary file in the same directory and rename it in place
+    """
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,67 @@
+import ipaddress
+import os
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from international import localize
+
+DATABASE_NAME = "GeoLite2-Country.mmdb"
+
+class Command(BaseCommand):
+    help = "Compile the GeoIP2 country database to a memory-mapped range table (settings.GEOIP_ENGINE = 'rangetable')"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--benchmark", type=int, default=0, metavar="N",
+            help="Compare lookup speed of N random IP addresses against the GeoIP2 reader",
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, "GEOIP_PATH", ""):
+            raise CommandError("Set GEOIP_PATH in settings.py to the directory of the GeoIP2 database")
+
+        database_path = os.path.join(settings.GEOIP_PATH, getattr(settings, "GEOIP_COUNTRY", DATABASE_NAME))
+        path = localize.get_range_table_path()
+
+        start = time.perf_counter()
+        n4, n6 = localize.RangeTable.compile(database_path, path)
+        self.stdout.write(self.style.SUCCESS(
+            "..Successfully compiled {0} IPv4 and {1} IPv6 ranges to {2} ({3:.1f}s, {4:.1f} MB)".format(
+                n4, n6, path, time.perf_counter() - start, os.path.getsize(path) / 1e6)
+        ))
+
+        if options["benchmark"]:
+            self.benchmark(path, options["benchmark"])
+
+    def benchmark(self, path, n):
+        table = localize.RangeTable(path)
+        geoip = localize.get_geoip()
+
+        ips = [str(ipaddress.IPv4Address(random.getrandbits(32))) for _ in range(n)]
+
+        def geoip_country(ip):
+            try:
+                return geoip.country(ip)["country_code"]
+            except Exception:
+                return None
+
+        start = time.perf_counter()
+        expected = [geoip_country(ip) for ip in ips]
+        geoip_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        single = [table.lookup(ip) for ip in ips]
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bulk = table.lookup_many(ips)
+        bulk_time = time.perf_counter() - start
+
+        for name, seconds in (("GeoIP2", geoip_time), ("RangeTable.lookup", single_time), ("RangeTable.lookup_many", bulk_time)):
+            self.stdout.write("{0:<24} {1:>10.2f} us/lookup".format(name, seconds / n * 1e6))
+
+        mismatches = sum(1 for a, b, c in zip(expected, single, bulk) if not a == b == c)
+        self.stdout.write("Mismatches with GeoIP2: {0} of {1}".format(mismatches, n))
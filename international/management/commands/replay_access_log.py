@@ -0,0 +1,157 @@
+import gzip
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+from django.contrib.gis.geoip2 import GeoIP2
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.http import HttpResponse
+from django.middleware.locale import LocaleMiddleware
+from django.test import RequestFactory
+from django.utils.module_loading import import_string
+
+from international.localize import RangeTable
+from international.models import CountrySite
+
+# Common/combined log format, optionally prefixed with the virtual host
+# (vhost_combined) and followed by a quoted cookie field:
+# [vhost[:port]] host ident user [time] "request" status size ["referer" "user agent" ["cookie"]]
+LOG_LINE_RE = re.compile(
+    r'^(?:(?P<vhost>\S+) )?(?P<remote_addr>\S+) \S+ \S+ \[[^\]]*\] '
+    r'"(?P<method>[A-Z]+) (?P<target>\S+)[^"]*" \S+ \S+'
+    r'(?: "(?P<referer>[^"]*)" "(?P<user_agent>[^"]*)"(?: "(?P<cookie>[^"]*)")?)?'
+)
+
+class Command(BaseCommand):
+    help = (
+        "Replay an access log through the country site resolution and middleware "
+        "(without serving HTTP) and report resolution sources and cost"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("logfile", help="Access log in common/combined format (.gz allowed), - for stdin")
+        parser.add_argument("--host", default="localhost", help="Host for log lines without virtual host field")
+        parser.add_argument("--limit", type=int, default=0, help="Replay at most this many requests")
+        parser.add_argument(
+            "--middleware", default="international.middleware.InternationalSiteMiddleware",
+            help="Middleware class to replay requests through",
+        )
+
+    def handle(self, *args, **options):
+        middleware_class = import_string(options["middleware"])
+        middleware = middleware_class(self.get_response)
+
+        # The middleware may need request.LANGUAGE_CODE (e.g. FORCE_COUNTRY_LANGUAGE)
+        if not issubclass(middleware_class, LocaleMiddleware):
+            middleware = LocaleMiddleware(middleware)
+
+        factory = RequestFactory()
+
+        sources = Counter()
+        errors = Counter()
+        replayed = skipped = geoip_lookups = queries = 0
+        elapsed = 0.0
+
+        # Count lookups in the GeoIP database or range table made while resolving
+        def count_lookups(stack, cls, name):
+            method = getattr(cls, name)
+
+            def counting_method(self, *args, **kwargs):
+                nonlocal geoip_lookups
+                geoip_lookups += 1
+                return method(self, *args, **kwargs)
+
+            setattr(cls, name, counting_method)
+            stack.callback(setattr, cls, name, method)
+
+        # Count database queries on all connections
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        CountrySite.objects.clear_cache()
+        with ExitStack() as stack:
+            count_lookups(stack, GeoIP2, "country")
+            count_lookups(stack, RangeTable, "lookup")
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_queries))
+
+            for line in self.read_lines(options["logfile"]):
+                if options["limit"] and replayed >= options["limit"]:
+                    break
+
+                match = LOG_LINE_RE.match(line)
+                if not match:
+                    skipped += 1
+                    continue
+
+                request = self.build_request(factory, match, options["host"])
+
+                start = time.perf_counter()
+                try:
+                    middleware(request)
+                except Exception as e:
+                    errors[type(e).__name__] += 1
+                else:
+                    if getattr(request, "_international_excluded", False):
+                        source = "excluded"
+                    else:
+                        source = getattr(request, "country_site_source", None) or "unknown"
+                    sources[source] += 1
+                elapsed += time.perf_counter() - start
+                replayed += 1
+
+        if not replayed:
+            raise CommandError("No requests found in {0} ({1} lines skipped)".format(options["logfile"], skipped))
+
+        self.stdout.write(self.style.SUCCESS(
+            "Replayed {0} requests in {1:.2f}s ({2:.0f} requests/s), {3} lines skipped".format(
+                replayed, elapsed, replayed / elapsed if elapsed else 0, skipped)
+        ))
+
+        self.stdout.write("Resolution source:")
+        for source, count in sources.most_common():
+            self.stdout.write("  {0:<12} {1:>8} {2:>6.1f}%".format(source, count, 100.0 * count / replayed))
+        for error, count in errors.most_common():
+            self.stdout.write(self.style.WARNING("  {0:<12} {1:>8} {2:>6.1f}%".format(error, count, 100.0 * count / replayed)))
+
+        self.stdout.write("GeoIP lookups per 1k requests: {0:.1f}".format(1000.0 * geoip_lookups / replayed))
+        self.stdout.write("DB queries per 1k requests: {0:.1f}".format(1000.0 * queries / replayed))
+
+    def get_response(self, request):
+        # Like a view using the country site, which is resolved lazily on first use
+        if not getattr(request, "_international_excluded", False):
+            str(request.country_site)
+        return HttpResponse()
+
+    def read_lines(self, path):
+        if path == "-":
+            return sys.stdin
+        if path.endswith(".gz"):
+            return gzip.open(path, "rt", errors="replace")
+        return open(path, errors="replace")
+
+    def build_request(self, factory, match, default_host):
+        target = match.group("target")
+        host = match.group("vhost") or default_host
+
+        # Absolute request target, e.g. from proxy logs
+        if "://" in target:
+            url = urlsplit(target)
+            host = url.netloc or host
+            target = url.path + ("?" + url.query if url.query else "")
+
+        extra = {
+            "HTTP_HOST": host,
+            "REMOTE_ADDR": match.group("remote_addr"),
+        }
+        for field, header in (("user_agent", "HTTP_USER_AGENT"), ("referer", "HTTP_REFERER"), ("cookie", "HTTP_COOKIE")):
+            if match.group(field) not in (None, "", "-"):
+                extra[header] = match.group(field)
+
+        return factory.generic(match.group("method"), target, **extra)
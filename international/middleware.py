@@ -1,10 +1,29 @@
 import datetime
+import re
+from functools import lru_cache
+
+from django.conf.urls.i18n import is_language_prefix_patterns_used
+from django.middleware.locale import LocaleMiddleware
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject, empty
 from django.utils import translation
+from django.utils.translation.trans_real import language_code_re, parse_accept_lang_header
 from django.conf import settings
 from django.utils import timezone 
+from .current import reset_current_country_site, set_current_country_site
 from .models import CountrySite
-from .views import get_country_data_from_request
+from .preload import check_preload_freshness
+from .views import LOCAL_DC_UNDETECTED_COOKIE, get_country_data_from_request
+
+@lru_cache(maxsize=None)
+def get_crawler_re():
+    """
+    Compiled regex matching the user agents of crawlers, words from
+    settings.CRAWLER_USER_AGENTS (default "bot" and "spider")
+    """
+
+    words = getattr(settings, "CRAWLER_USER_AGENTS", ("bot", "spider"))
+    return re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
 
 def is_crawler_request(request):
     """
@@ -13,21 +32,71 @@ def is_crawler_request(request):
 
     user_agent = request.META.get("HTTP_USER_AGENT")
     if user_agent:
-        if "bot" in user_agent.lower():
-            return True 
-
-        if "spider" in user_agent.lower():
-            return True
+        return get_crawler_re().search(user_agent) is not None
 
     return False
 
+def compile_path_matcher(paths):
+    """
+    Return function that checks if a path starts with one of the given
+    prefixes or matches one of the given regexes (starting with ^)
+    """
+
+    prefixes = tuple(path for path in paths if not path.startswith("^"))
+    regexes = [path for path in paths if path.startswith("^")]
+    regex = re.compile("|".join("(?:{0})".format(r) for r in regexes)) if regexes else None
+
+    def matches(path):
+        return path.startswith(prefixes) or (regex is not None and regex.match(path) is not None)
+
+    return matches
+
+def get_excluded_paths():
+    """
+    Paths the middleware ignores, settings.INTERNATIONAL_EXCLUDE_PATHS or
+    by default the static and media files and favicon
+    """
+
+    paths = getattr(settings, "INTERNATIONAL_EXCLUDE_PATHS", None)
+    if paths is None:
+        # An empty MEDIA_URL is "/" (script prefix), which would exclude everything
+        paths = [url for url in (settings.STATIC_URL, settings.MEDIA_URL) if url != "/"] + ["/favicon.ico"]
+
+    return [path for path in paths if path and (path.startswith("/") or path.startswith("^"))]
+
+def is_country_site_resolved(request):
+    """
+    Check if the (lazy) request.country_site has been used during the request
+    """
+
+    country_site = getattr(request, "country_site", None)
+    if isinstance(country_site, SimpleLazyObject):
+        return country_site._wrapped is not empty
+    return country_site is not None
+
 class InternationalSiteMiddleware(MiddlewareMixin):
     """
     Middleware that sets `country` attribute to request object.
+
+    The country site is resolved on first access of request.country_site, and
+    requests for paths in settings.INTERNATIONAL_EXCLUDE_PATHS are ignored.
     """
 
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.is_excluded_path = compile_path_matcher(get_excluded_paths())
+
+    def set_country_site(self, request):
+        request.country_site = SimpleLazyObject(lambda: CountrySite.objects.get_current(request))
+        request._country_site_token = set_current_country_site(request.country_site)
+
     def process_request(self, request):
-        request.country_site = CountrySite.objects.get_current(request)
+        if self.is_excluded_path(request.path_info):
+            request._international_excluded = True
+            return
+
+        check_preload_freshness()
+        self.set_country_site(request)
 
         # Set language based on country site if wanted
         if (getattr(settings, "FORCE_COUNTRY_LANGUAGE", False)):
@@ -38,12 +107,17 @@ class InternationalSiteMiddleware(MiddlewareMixin):
 
 
     def process_response(self, request, response):
-        local = request.COOKIES.get("local", "")
-        country_code = request.country_site.country_code
+        if getattr(request, "_international_excluded", False) or not hasattr(request, "country_site"):
+            return response
 
-        # For use by js frontend
-        if local != country_code:
-            response.set_cookie("local", country_code)
+        if hasattr(request, "_country_site_token"):
+            reset_current_country_site(request._country_site_token)
+
+        # For use by js frontend, only when the country site was used for this response
+        if is_country_site_resolved(request):
+            country_code = request.country_site.country_code
+            if request.COOKIES.get("local", "") != country_code:
+                response.set_cookie("local", country_code)
 
         # Detect location if not know already
         if not getattr(settings, "GEOIP_REDIRECT", False):
@@ -51,11 +125,12 @@ class InternationalSiteMiddleware(MiddlewareMixin):
 
                 # Skip location detection for known crawlers
                 if not is_crawler_request(request):
-                    detection = get_country_data_from_request(request)
-                    detected_country_code = {"GB": "UK"}.get(detection["country"], detection["country"])
+                    detected_country_code = get_country_data_from_request(request)["country"]
+                    detected = bool(detected_country_code)
                 else:
                     # For crawlers use value of current country site
-                    detected_country_code = country_code
+                    detected_country_code = request.country_site.country_code
+                    detected = False
 
                 expires = timezone.now() + timezone.timedelta(days=2)
                 expires = datetime.datetime.strftime(expires, "%a, %d-%b-%Y %H:%M:%S GMT")
@@ -65,4 +140,159 @@ class InternationalSiteMiddleware(MiddlewareMixin):
                     
                 response.set_cookie("local_dc", detected_country_code, expires=expires)
 
+                # Mark fallback values, so the localize/ endpoint doesn't report them as detected
+                if not detected:
+                    response.set_cookie(LOCAL_DC_UNDETECTED_COOKIE, "1", expires=expires)
+                elif LOCAL_DC_UNDETECTED_COOKIE in request.COOKIES:
+                    response.delete_cookie(LOCAL_DC_UNDETECTED_COOKIE)
+
         return response
+
+
+def get_supported_languages(languages):
+    """
+    Return tuple of the supported variants (as returned by the cached
+    get_supported_language_variant) of language codes
+    """
+
+    supported = []
+    for lang_code in languages:
+        try:
+            lang_code = translation.get_supported_language_variant(lang_code)
+        except LookupError:
+            continue
+        if lang_code not in supported:
+            supported.append(lang_code)
+
+    return tuple(supported)
+
+
+def get_country_languages(country_site):
+    """
+    Return tuple of (supported) language codes allowed on a country site,
+    None if all settings.LANGUAGES are allowed
+    """
+
+    languages = getattr(settings, "COUNTRY_LANGUAGES", {}).get(country_site.country_code)
+    if languages:
+        return get_supported_languages(languages)
+
+    if getattr(settings, "FORCE_COUNTRY_LANGUAGE", False):
+        return get_supported_languages((country_site.default_language,))
+
+    return None
+
+
+def get_supported_language(lang_code, allowed=None):
+    """
+    Return supported variant of lang_code if it is allowed, None otherwise
+    """
+
+    if not lang_code:
+        return None
+
+    try:
+        lang_code = translation.get_supported_language_variant(lang_code)
+    except LookupError:
+        return None
+
+    if allowed is not None and lang_code not in allowed:
+        return None
+
+    return lang_code
+
+
+@lru_cache(maxsize=1000)
+def get_language_from_accept_header(accept, allowed=None):
+    """
+    Return the first allowed language in an Accept-Language header, None if
+    there is none. Results are cached per header and allowed languages.
+    """
+
+    for accept_lang, unused in parse_accept_lang_header(accept):
+        if accept_lang == "*":
+            break
+
+        if not language_code_re.search(accept_lang):
+            continue
+
+        lang_code = get_supported_language(accept_lang, allowed)
+        if lang_code:
+            return lang_code
+
+    return None
+
+
+class InternationalLocaleMiddleware(InternationalSiteMiddleware, LocaleMiddleware):
+    """
+    Drop-in replacement for Django's LocaleMiddleware and the
+    InternationalSiteMiddleware that resolves the country site first and then
+    negotiates the language once, only choosing from the languages allowed on
+    the country site (settings.COUNTRY_LANGUAGES, or only the default language
+    with FORCE_COUNTRY_LANGUAGE).
+
+    Language is taken from the url prefix (i18n_patterns), the language cookie,
+    the Accept-Language header, the country site default language or
+    settings.LANGUAGE_CODE (when all languages are allowed), in that order.
+    Paths in settings.INTERNATIONAL_EXCLUDE_PATHS get the language of Django's
+    LocaleMiddleware, without country site.
+    """
+
+    def get_language(self, request, check_path=False):
+        country_site = request.country_site
+        allowed = get_country_languages(country_site)
+
+        if check_path:
+            lang_code = get_supported_language(translation.get_language_from_path(request.path_info), allowed)
+            if lang_code:
+                return lang_code
+
+        lang_code = get_supported_language(request.COOKIES.get(settings.LANGUAGE_COOKIE_NAME), allowed)
+        if lang_code:
+            return lang_code
+
+        lang_code = get_language_from_accept_header(request.META.get("HTTP_ACCEPT_LANGUAGE", ""), allowed)
+        if lang_code:
+            return lang_code
+
+        lang_code = get_supported_language(country_site.default_language, allowed)
+        if lang_code:
+            return lang_code
+
+        if allowed is None:
+            return settings.LANGUAGE_CODE
+
+        # Never fall back to a language that is not allowed on the country site
+        return allowed[0] if allowed else country_site.default_language
+
+    def process_request(self, request):
+        if self.is_excluded_path(request.path_info):
+            # No country site, but still negotiate the language like LocaleMiddleware
+            request._international_excluded = True
+            return LocaleMiddleware.process_request(self, request)
+
+        check_preload_freshness()
+        self.set_country_site(request)
+
+        urlconf = getattr(request, "urlconf", settings.ROOT_URLCONF)
+        i18n_patterns_used, prefixed_default_language = is_language_prefix_patterns_used(urlconf)
+
+        language = None
+        country_languages = getattr(settings, "COUNTRY_LANGUAGES", {}).get(request.country_site.country_code)
+        if getattr(settings, "FORCE_COUNTRY_LANGUAGE", False) and not country_languages:
+            # Like InternationalSiteMiddleware, always the default language of the country site
+            language = request.country_site.default_language
+
+        elif i18n_patterns_used and not prefixed_default_language and not translation.get_language_from_path(request.path_info):
+            # Unprefixed urls are in the default language, when allowed on this country site
+            language = get_supported_language(settings.LANGUAGE_CODE, get_country_languages(request.country_site))
+
+        if not language:
+            language = self.get_language(request, check_path=i18n_patterns_used)
+
+        translation.activate(language)
+        request.LANGUAGE_CODE = translation.get_language()
+
+    def process_response(self, request, response):
+        response = LocaleMiddleware.process_response(self, request, response)
+        return InternationalSiteMiddleware.process_response(self, request, response)
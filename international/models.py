@@ -1,69 +1,237 @@
-from django.db import models
+import logging
+import time
+from uuid import uuid4
+
+from django.db import DatabaseError, models, router
 from django.db.models import Q
 from django.conf import settings
 from django.http.request import split_domain_port
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.core.files.storage import FileSystemStorage
 
 # from django.contrib.gis.geoip2 import GeoIP2
 # from django.core.validators import URLValidator
 
-from .localize import get_country_from_ip
+from .domains import clear_domain_trie, get_country_code_for_host
+from .localize import get_country_from_header, get_country_from_ip
+
+logger = logging.getLogger(__name__)
 
 # Similar to Sites cache https://github.com/django/django/blob/main/django/contrib/sites/models.py
+# Keyed by database alias, then country code
 COUNTRY_SITE_CACHE = {}
 
+# Tuple of active country sites, keyed by database alias
+ACTIVE_SITES_CACHE = {}
+
+# Snapshot of all country sites shared by processes in the Django cache
+# settings.COUNTRY_SITE_SHARED_CACHE, keyed by database alias. It is valid
+# while its generation matches the generation key, which is replaced each
+# time a country site is saved or deleted.
+SHARED_CACHE_KEY = "international.country_sites.%s"
+SHARED_CACHE_TIMEOUT = 60 * 60
+
+# Generation of the shared snapshot loaded in this process, keyed by database alias
+SHARED_CACHE_GENERATIONS = {}
+
+# Seconds the lock of the process rebuilding the snapshot is held at most,
+# and other processes wait for the snapshot before querying the database
+SHARED_CACHE_LOCK_TIMEOUT = 10
+SHARED_CACHE_WAIT = 1.0
+
 STATIC_STORAGE = FileSystemStorage(location=settings.STATIC_ROOT)
 
+def get_shared_cache():
+    """
+    Return the Django cache of settings.COUNTRY_SITE_SHARED_CACHE, None if not set
+    """
+    alias = getattr(settings, "COUNTRY_SITE_SHARED_CACHE", None)
+    return caches[alias] if alias else None
+
 class CountrySiteManager(models.Manager):
     use_in_migrations = True
 
     def active_sites(self):
         return self.get_queryset().filter(active=True)
 
+    def get_active_sites(self):
+        """
+        Return tuple of active country sites, cached until a country site is
+        saved or deleted
+        """
+        using = self._db or router.db_for_read(self.model)
+        if using not in ACTIVE_SITES_CACHE:
+            if get_shared_cache() is not None:
+                self.prime_cache()
+            else:
+                ACTIVE_SITES_CACHE[using] = tuple(self.using(using).filter(active=True))
+        return ACTIVE_SITES_CACHE[using]
+
+    def prime_cache(self):
+        """
+        Load all country sites in the cache with a single query, or from the
+        shared cache when settings.COUNTRY_SITE_SHARED_CACHE is set
+        """
+        using = self._db or router.db_for_read(self.model)
+        sites = self._load_sites(using)
+        COUNTRY_SITE_CACHE[using] = {site.country_code: site for site in sites}
+        ACTIVE_SITES_CACHE[using] = tuple(site for site in sites if site.active)
+        return sites
+
+    def _load_sites(self, using):
+        """
+        Return list of all country sites, from the shared cache when
+        configured and available, from the database otherwise
+        """
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return list(self.using(using).all())
+
+        try:
+            return self._load_shared_sites(shared_cache, using)
+        except DatabaseError:
+            raise
+        except Exception as e:
+            # The shared cache is optional, e.g. during a Redis/memcached outage
+            logger.warning("Could not use shared country site cache: %s", e)
+            SHARED_CACHE_GENERATIONS.pop(using, None)
+            return list(self.using(using).all())
+
+    def _load_shared_sites(self, shared_cache, using):
+        """
+        Return list of all country sites from the shared cache snapshot. When
+        there is no valid snapshot, one process rebuilds it from the database
+        while the others wait for it (at most SHARED_CACHE_WAIT seconds).
+        """
+        key = SHARED_CACHE_KEY % using
+        generation_key = key + ".generation"
+        lock_key = key + ".lock"
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+
+        def read_snapshot():
+            cached = shared_cache.get_many([key, generation_key])
+            generation = cached.get(generation_key)
+            snapshot = cached.get(key)
+            if (
+                snapshot is not None and generation is not None
+                and snapshot["generation"] == generation and snapshot["fields"] == fields
+            ):
+                return [self.model.from_db(using, fields, row) for row in snapshot["rows"]], generation
+            return None, generation
+
+        deadline = time.monotonic() + SHARED_CACHE_WAIT
+        while True:
+            sites, generation = read_snapshot()
+            SHARED_CACHE_GENERATIONS[using] = generation
+            if sites is not None:
+                return sites
+
+            if shared_cache.add(lock_key, True, SHARED_CACHE_LOCK_TIMEOUT):
+                break
+
+            if time.monotonic() >= deadline:
+                return list(self.using(using).all())
+            time.sleep(0.05)
+
+        try:
+            # Another process may have stored the snapshot before the lock was taken
+            sites, generation = read_snapshot()
+            SHARED_CACHE_GENERATIONS[using] = generation
+            if sites is not None:
+                return sites
+
+            if generation is None:
+                shared_cache.add(generation_key, uuid4().hex, None)
+                generation = shared_cache.get(generation_key)
+                SHARED_CACHE_GENERATIONS[using] = generation
+
+            sites = list(self.using(using).all())
+            shared_cache.set(key, {
+                "generation": generation,
+                "fields": fields,
+                "rows": [tuple(getattr(site, field) for field in fields) for site in sites],
+            }, getattr(settings, "COUNTRY_SITE_SHARED_CACHE_TIMEOUT", SHARED_CACHE_TIMEOUT))
+        finally:
+            shared_cache.delete(lock_key)
+
+        return sites
+
+    def _is_shared_snapshot_changed(self, using):
+        """
+        Return whether the shared snapshot was replaced since this process
+        loaded it, e.g. after a country site was saved by another process
+        """
+        try:
+            generation = get_shared_cache().get(SHARED_CACHE_KEY % using + ".generation")
+        except Exception as e:
+            logger.warning("Could not use shared country site cache: %s", e)
+            return False
+        return generation != SHARED_CACHE_GENERATIONS.get(using)
+
     def _get_site_by_country_code(self, country_code):
-        if country_code not in COUNTRY_SITE_CACHE:
-            site = self.get(country_code=country_code)
-            SITE_CACHE[country_code] = site
-        return SITE_CACHE[country_code]
+        using = self._db or router.db_for_read(self.model)
+
+        # With a shared cache all country sites are loaded at once, and reloaded
+        # on a miss when the snapshot changed. Sites missing from the snapshot
+        # (e.g. after a failed save) are read from the database.
+        if get_shared_cache() is not None:
+            if using not in ACTIVE_SITES_CACHE:
+                self.prime_cache()
+            elif country_code not in COUNTRY_SITE_CACHE.get(using, {}) and self._is_shared_snapshot_changed(using):
+                self.prime_cache()
+
+        cache = COUNTRY_SITE_CACHE.setdefault(using, {})
+        if country_code not in cache:
+            cache[country_code] = self.using(using).get(country_code=country_code)
+        return cache[country_code]
 
     def _get_country_site_by_request(self, request):
         host = request.get_host()
 
         country_code = None
+        source = None
 
         try:
-            # For unique domain names, map to countrycode without db
-            uniques = getattr(settings, "UNIQUE_DOMAINS", {})
-            if host in uniques:
-                country_code = uniques[host]
+            # For unique domain names (settings or country site domains), map to countrycode without db
+            domain_country_code = get_country_code_for_host(host)
+            if domain_country_code:
+                country_code = domain_country_code
+                source = "domain"
 
             # For GET requests on generic .com domain, check if url parameter is used to force locale
             elif request.method == "GET" and request.GET.get("c"):
                 country_code = request.GET["c"].upper()
+                source = "param"
 
             # Check if user already has location saved in cookie
             elif request.COOKIES.get("local", False):
                 # country_code = request.session.get("local")
                 country_code = request.COOKIES.get("local")
+                source = "cookie"
 
             # TODO: If none of the above: Detect location based on IP
             elif getattr(settings, "GEOIP_REDIRECT", False):
-                country_code = get_country_from_ip(request)
+                country_code = get_country_from_header(request)
+                source = "header"
+
+                if not country_code:
+                    country_code = get_country_from_ip(request)
+                    source = "geoip"
 
                 if settings.DEBUG:
                     print("Detected country code from IP: {0}".format(country_code))
 
             if not country_code:
                 country_code = getattr(settings, "DEFAULT_COUNTRY_CODE", '')
+                source = "default"
 
-            # First attempt to look up the site by host with or without port.
-            if country_code not in COUNTRY_SITE_CACHE:
-                country_site = self.get(country_code=country_code)
-                COUNTRY_SITE_CACHE[country_code] = country_site
+            # Resolution source, e.g. for debugging and replay_access_log statistics
+            request.country_site_source = source
 
-            return COUNTRY_SITE_CACHE[country_code]
+            # First attempt to look up the site by host with or without port.
+            return self._get_site_by_country_code(country_code)
 
         except CountrySite.DoesNotExist:
 
@@ -75,14 +243,13 @@ class CountrySiteManager(models.Manager):
                 if port in getattr(settings, "DEBUG_UNIQUE_DOMAINS", {}):
                     country_code = settings.DEBUG_UNIQUE_DOMAINS[port]
                     print(country_code)
-                    COUNTRY_SITE_CACHE[country_code] = self.get(country_code=country_code)
-
-                    return COUNTRY_SITE_CACHE[country_code]
+                    request.country_site_source = "debug_port"
+                    return self._get_site_by_country_code(country_code)
 
             country_code = getattr(settings, "DEFAULT_COUNTRY_CODE", "")
             if country_code:
-                COUNTRY_SITE_CACHE[country_code] = self.get(country_code=country_code)
-                return COUNTRY_SITE_CACHE[country_code]
+                request.country_site_source = "default"
+                return self._get_site_by_country_code(country_code)
 
             raise ImproperlyConfigured(
                 "You're using the \"international\" app without having "
@@ -118,6 +285,9 @@ class CountrySiteManager(models.Manager):
         """Clear the ``CountrySite`` object cache."""
         global COUNTRY_SITE_CACHE
         COUNTRY_SITE_CACHE = {}
+        ACTIVE_SITES_CACHE.clear()
+        SHARED_CACHE_GENERATIONS.clear()
+        clear_domain_trie()
 
     # def get_by_natural_key(self, country_code):
     #     return self.get(country_code=country_code)
@@ -171,9 +341,9 @@ class CountrySite(models.Model):
 
     def get_country_site_switch_url(self):
 
-        unique = getattr(settings, "UNIQUE_DOMAINS", {})
-        if getattr(unique, self.domain, False):
-            return self.domain 
+        # Domain resolves to this country site (e.g. in UNIQUE_DOMAINS), no url parameter needed
+        if get_country_code_for_host(self.domain) == self.country_code:
+            return "//" + self.domain
 
         return "//" + self.domain + "?c={0}".format(self.country_code)
 
@@ -242,10 +412,37 @@ def clear_country_site_cache(sender, **kwargs):
     instance = kwargs['instance']
     using = kwargs['using']
     try:
-        del COUNTRY_SITE_CACHE[CountrySite.objects.using(using).get(pk=instance.pk).country_code]
+        del COUNTRY_SITE_CACHE[using][CountrySite.objects.using(using).get(pk=instance.pk).country_code]
     except (KeyError, CountrySite.DoesNotExist):
         pass
 
 
+def clear_active_sites_cache(sender, **kwargs):
+    """
+    Clear the active sites cache each time a country site is saved or deleted.
+    """
+    ACTIVE_SITES_CACHE.pop(kwargs['using'], None)
+
+
+def clear_shared_cache(sender, **kwargs):
+    """
+    Invalidate the shared snapshot each time a country site is saved or deleted.
+    """
+    shared_cache = get_shared_cache()
+    if shared_cache is not None:
+        key = SHARED_CACHE_KEY % kwargs['using']
+        try:
+            shared_cache.set(key + ".generation", uuid4().hex, None)
+            shared_cache.delete(key)
+        except Exception as e:
+            logger.warning("Could not invalidate shared country site cache, it expires after its timeout: %s", e)
+
+
 pre_save.connect(clear_country_site_cache, sender=CountrySite)
-pre_delete.connect(clear_country_site_cache, sender=CountrySite)
\ No newline at end of file
+pre_delete.connect(clear_country_site_cache, sender=CountrySite)
+post_save.connect(clear_active_sites_cache, sender=CountrySite)
+post_delete.connect(clear_active_sites_cache, sender=CountrySite)
+post_save.connect(clear_domain_trie, sender=CountrySite)
+post_delete.connect(clear_domain_trie, sender=CountrySite)
+post_save.connect(clear_shared_cache, sender=CountrySite)
+post_delete.connect(clear_shared_cache, sender=CountrySite)
@@ -0,0 +1,103 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Seconds the preloaded country sites are used by forked workers before reloading
+PRELOAD_MAX_AGE = 5 * 60
+
+# time.monotonic() of the last warm_up, None if not preloaded
+_PRELOADED_AT = None
+
+# Set in forked child processes, checked on the first request
+_CHECK_PENDING = False
+
+# Whether _after_fork is registered with os.register_at_fork
+_FORK_HOOK_REGISTERED = False
+
+
+def warm_up():
+    """
+    Load the country sites, domain trie, country switcher, crawler matcher and
+    GeoIP database in this process. Call it where the server loads the
+    application (e.g. wsgi.py), so with e.g. gunicorn --preload the forked
+    workers share this state copy-on-write. Returns the names of what was loaded.
+    """
+
+    global _PRELOADED_AT, _FORK_HOOK_REGISTERED
+
+    from .context_processors import get_country_site_switches
+    from .domains import get_domain_trie
+    from .localize import get_geoip, get_range_table, use_range_table
+    from .middleware import get_crawler_re
+    from .models import CountrySite
+
+    start = time.perf_counter()
+    get_crawler_re()
+    loaded = ["crawler matcher"]
+
+    try:
+        sites = CountrySite.objects.prime_cache()
+        get_domain_trie()
+        get_country_site_switches()
+    except DatabaseError as e:
+        # E.g. before migrations have been applied
+        logger.warning("Could not preload country sites: %s", e)
+        CountrySite.objects.clear_cache()
+    else:
+        loaded.append("%d country sites" % len(sites))
+    finally:
+        # Database connections must not be shared with forked workers
+        connections.close_all()
+
+    if getattr(settings, "GEOIP_PATH", False):
+        try:
+            if use_range_table():
+                get_range_table()
+                loaded.append("GeoIP range table")
+            else:
+                get_geoip()
+                loaded.append("GeoIP database")
+        except Exception as e:
+            logger.warning("Could not preload GeoIP database: %s", e)
+
+    _PRELOADED_AT = time.monotonic()
+    if hasattr(os, "register_at_fork") and not _FORK_HOOK_REGISTERED:
+        os.register_at_fork(after_in_child=_after_fork)
+        _FORK_HOOK_REGISTERED = True
+
+    logger.info("Preloaded %s in %.1f ms", ", ".join(loaded), (time.perf_counter() - start) * 1000)
+    return loaded
+
+
+def _after_fork():
+    global _CHECK_PENDING
+    _CHECK_PENDING = _PRELOADED_AT is not None
+
+
+def check_preload_freshness():
+    """
+    On the first request after a fork, drop preloaded country sites older than
+    INTERNATIONAL_PRELOAD_MAX_AGE seconds and recheck the GeoIP database
+    generation, so workers forked long after the preload don't serve stale data
+    """
+
+    global _CHECK_PENDING
+
+    if not _CHECK_PENDING:
+        return
+    _CHECK_PENDING = False
+
+    from .localize import recheck_geoip_generation
+    from .models import CountrySite
+
+    age = time.monotonic() - _PRELOADED_AT
+    if age > getattr(settings, "INTERNATIONAL_PRELOAD_MAX_AGE", PRELOAD_MAX_AGE):
+        logger.info("Preloaded country sites are %.0fs old, reloading", age)
+        CountrySite.objects.clear_cache()
+
+    recheck_geoip_generation()
@@ -0,0 +1,75 @@
+from django.conf import settings
+
+from .current import get_current_country_site
+from .models import CountrySite, InternationalModel
+
+
+class CountrySiteRouter:
+    """
+    Database router that sends queries for InternationalModel subclasses to the
+    database of the current request's country site, configured per country code
+    (use the same alias for all countries of a region):
+
+        DATABASE_ROUTERS = ["international.routers.CountrySiteRouter"]
+        INTERNATIONAL_DATABASES = {"NL": "eu", "DE": "eu", "US": "us"}
+
+    Only reads are routed unless INTERNATIONAL_ROUTE_WRITES is True. CountrySite
+    rows are read from and written to COUNTRY_SITE_DATABASE (when set), except
+    the country sites of an object, which are read from the database of the object.
+    """
+
+    def _is_international(self, model):
+        if issubclass(model, InternationalModel):
+            return True
+
+        # Auto created many to many table of InternationalModel.country_sites
+        if model._meta.auto_created:
+            return any(
+                field.related_model is not None and issubclass(field.related_model, InternationalModel)
+                for field in model._meta.fields
+            )
+
+        return False
+
+    def _db_for_country(self, model, **hints):
+        if not self._is_international(model):
+            return None
+
+        # Keep related objects in the database of the instance
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+
+        country_site = get_current_country_site()
+        if country_site is None:
+            return None
+
+        return getattr(settings, "INTERNATIONAL_DATABASES", {}).get(country_site.country_code)
+
+    def db_for_read(self, model, **hints):
+        if model is CountrySite:
+            # Country sites of an object (product.country_sites.all()) are joined
+            # with the many to many table in the database of the object
+            instance = hints.get("instance")
+            if isinstance(instance, InternationalModel) and instance._state.db:
+                return instance._state.db
+
+            return getattr(settings, "COUNTRY_SITE_DATABASE", None)
+
+        return self._db_for_country(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        if model is CountrySite:
+            return getattr(settings, "COUNTRY_SITE_DATABASE", None)
+
+        if getattr(settings, "INTERNATIONAL_ROUTE_WRITES", False):
+            return self._db_for_country(model, **hints)
+
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Country sites are expected to be available (replicated) in every database
+        if isinstance(obj1, CountrySite) or isinstance(obj2, CountrySite):
+            return True
+
+        return None
@@ -0,0 +1,50 @@
+from django.template import Library, TemplateSyntaxError
+from django.templatetags.cache import CacheNode
+
+from international.cache import get_country_cache_vary
+
+register = Library()
+
+
+class CountryVary:
+    """
+    Resolves to the country code (index 0) or language (index 1) of the
+    current request, used as extra vary_on argument of CacheNode
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def resolve(self, context):
+        return get_country_cache_vary(context.get("request"))[self.index]
+
+
+@register.tag("country_cache")
+def do_country_cache(parser, token):
+    """
+    Like Django's {% cache %} tag, but the fragment is cached per country site
+    and language (the same key as cache_page_per_country)::
+
+        {% load international %}
+        {% country_cache 500 sidebar [var1] [var2] .. [using="cachename"] %}
+            .. some expensive processing ..
+        {% endcountry_cache %}
+    """
+
+    nodelist = parser.parse(("endcountry_cache",))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise TemplateSyntaxError("'%r' tag requires at least 2 arguments." % tokens[0])
+    if len(tokens) > 3 and tokens[-1].startswith("using="):
+        cache_name = parser.compile_filter(tokens[-1][len("using="):])
+        tokens = tokens[:-1]
+    else:
+        cache_name = None
+    return CacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],  # fragment_name can't be a variable.
+        [CountryVary(0), CountryVary(1)] + [parser.compile_filter(t) for t in tokens[3:]],
+        cache_name,
+    )
@@ -0,0 +1,46 @@
+SECRET_KEY = "international-tests"
+
+ALLOWED_HOSTS = ["*"]
+
+DATABASES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+    "eu": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"},
+}
+
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "django.contrib.sessions",
+    "international",
+    "international.tests.testapp",
+]
+
+MIDDLEWARE = [
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "international.middleware.InternationalSiteMiddleware",
+]
+
+ROOT_URLCONF = "international.tests.urls"
+
+TEMPLATES = [{
+    "BACKEND": "django.template.backends.django.DjangoTemplates",
+    "APP_DIRS": True,
+    "OPTIONS": {"context_processors": ["django.template.context_processors.request"]},
+}]
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+USE_I18N = True
+USE_TZ = True
+LANGUAGE_CODE = "en"
+LANGUAGES = [("nl", "Dutch"), ("en", "English"), ("de", "German")]
+
+STATIC_URL = "/static/"
+STATIC_ROOT = "/tmp/static"
+MEDIA_URL = "/media/"
+
+DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
+DEFAULT_COUNTRY_CODE = "NL"
@@ -0,0 +1,110 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, override_settings
+from django.utils import translation
+from django.utils.cache import patch_vary_headers
+
+from international.cache import cache_page_per_country
+from international.models import CountrySite
+
+from .utils import CountrySiteTestCase
+
+
+class CachePagePerCountryTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.factory = RequestFactory()
+        self.calls = 0
+
+    def view(self, request, vary=(), cookie=False):
+        self.calls += 1
+        response = HttpResponse("{0} {1}".format(request.country_site.country_code, self.calls))
+        patch_vary_headers(response, vary)
+        if cookie:
+            response.set_cookie("visitor", "1")
+        return response
+
+    def get(self, country_code="NL", language="nl", view_kwargs=None, **extra):
+        request = self.factory.get("/page/", **extra)
+        request.country_site = CountrySite.objects.get_current(country_code=country_code)
+        request.LANGUAGE_CODE = language
+        request.user = AnonymousUser()
+        view = cache_page_per_country(60)(lambda request: self.view(request, **(view_kwargs or {})))
+        return view(request)
+
+    def test_cached_per_country(self):
+        self.assertEqual(self.get("NL", HTTP_COOKIE="local=NL; other=1").content, b"NL 1")
+        self.assertEqual(self.get("NL", HTTP_COOKIE="local=NL; other=2").content, b"NL 1")
+        self.assertEqual(self.get("DE").content, b"DE 2")
+        self.assertEqual(self.get("DE").content, b"DE 2")
+
+    def test_cached_per_language(self):
+        self.assertEqual(self.get("NL", "nl").content, b"NL 1")
+        self.assertEqual(self.get("NL", "en").content, b"NL 2")
+
+    def test_not_shared_downstream(self):
+        response = self.get("NL")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+    def test_vary_on_language_cached(self):
+        self.get("NL", view_kwargs={"vary": ["Accept-Language", "Cookie"]})
+        self.assertEqual(self.get("NL", view_kwargs={"vary": ["Accept-Language"]}).content, b"NL 1")
+
+    def test_vary_on_other_header_not_cached(self):
+        self.get("NL", view_kwargs={"vary": ["User-Agent"]}, HTTP_USER_AGENT="Mobile")
+        response = self.get("NL", view_kwargs={"vary": ["User-Agent"]}, HTTP_USER_AGENT="Desktop")
+        self.assertEqual(response.content, b"NL 2")
+
+    def test_response_with_cookies_not_cached(self):
+        self.get("NL", view_kwargs={"cookie": True})
+        self.assertEqual(self.get("NL").content, b"NL 2")
+
+    def test_session_cookie_bypass(self):
+        self.get("NL")
+        self.assertEqual(self.get("NL", HTTP_COOKIE="sessionid=abc").content, b"NL 2")
+
+    @override_settings(COUNTRY_CACHE_BYPASS_COOKIES=["cart"])
+    def test_bypass_cookies(self):
+        self.get("NL")
+        self.assertEqual(self.get("NL", HTTP_COOKIE="sessionid=abc").content, b"NL 1")
+        self.assertEqual(self.get("NL", HTTP_COOKIE="cart=1").content, b"NL 2")
+
+    def test_authorization_bypass(self):
+        self.get("NL")
+        self.assertEqual(self.get("NL", HTTP_AUTHORIZATION="Bearer x").content, b"NL 2")
+
+    def test_authenticated_bypass(self):
+        self.get("NL")
+        request = self.factory.get("/page/")
+        request.country_site = CountrySite.objects.get_current(country_code="NL")
+        request.LANGUAGE_CODE = "nl"
+        request.user = User(username="visitor")
+        self.assertEqual(cache_page_per_country(60)(self.view)(request).content, b"NL 2")
+
+
+class CountryCacheTagTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def render(self, country_code, value):
+        request = RequestFactory().get("/")
+        request.country_site = CountrySite.objects.get_current(country_code=country_code)
+        request.LANGUAGE_CODE = "nl"
+        template = Template("{% load international %}{% country_cache 60 fragment %}{{ value }}{% endcountry_cache %}")
+        with translation.override("nl"):
+            return template.render(Context({"request": request, "value": value}))
+
+    def test_cached_per_country(self):
+        self.assertEqual(self.render("NL", "a"), "a")
+        self.assertEqual(self.render("NL", "b"), "a")
+        self.assertEqual(self.render("DE", "c"), "c")
@@ -0,0 +1,44 @@
+from django.test import RequestFactory, override_settings
+
+from international.context_processors import country_sites, get_country_site_switches
+from international.models import CountrySite
+
+from .utils import CountrySiteTestCase
+
+
+class CountrySiteSwitchTests(CountrySiteTestCase):
+
+    def test_switches(self):
+        switches = {switch.country_code: switch for switch in get_country_site_switches()}
+        self.assertEqual(set(switches), {"NL", "DE", "UK", "US"})
+
+        self.assertEqual(switches["NL"].domain, "example.nl")
+        self.assertEqual(switches["NL"].language_name, "Dutch")
+        self.assertEqual(switches["NL"].icon, "")
+
+        # Own domain, or the shared domain with url parameter
+        self.assertEqual(switches["NL"].switch_url, "//example.nl")
+        self.assertEqual(switches["US"].switch_url, "//example.com?c=US")
+
+    @override_settings(SITE_ICON_DIR="/static/icons/")
+    def test_icon(self):
+        switches = {switch.country_code: switch for switch in get_country_site_switches()}
+        self.assertEqual(switches["DE"].icon, "/static/icons/DE.png")
+
+    def test_cached(self):
+        switches = get_country_site_switches()
+        with self.assertNumQueries(0):
+            self.assertIs(get_country_site_switches(), switches)
+
+    def test_rebuilt_on_change(self):
+        get_country_site_switches()
+
+        site = CountrySite.objects.get(country_code="DE")
+        site.active = False
+        site.save()
+
+        self.assertEqual({switch.country_code for switch in get_country_site_switches()}, {"NL", "UK", "US"})
+
+    def test_context_processor(self):
+        context = country_sites(RequestFactory().get("/"))
+        self.assertEqual(context["country_sites"], get_country_site_switches())
@@ -0,0 +1,73 @@
+from django.test import SimpleTestCase, override_settings
+
+from international.domains import DomainTrie, get_country_code_for_host
+from international.models import CountrySite
+
+from .utils import CountrySiteTestCase
+
+
+class DomainTrieTests(SimpleTestCase):
+
+    def setUp(self):
+        self.trie = DomainTrie()
+        self.trie.add("*.example.de", "DE")
+        self.trie.add("example.nl", "NL")
+        self.trie.add("*.example.nl", "NL")
+        self.trie.add("shop.example.nl", "BE")
+
+    def test_wildcard_matches_subdomains(self):
+        self.assertEqual(self.trie.resolve("shop.example.de"), "DE")
+        self.assertEqual(self.trie.resolve("a.b.example.de"), "DE")
+
+    def test_wildcard_does_not_match_domain(self):
+        self.assertIsNone(self.trie.resolve("example.de"))
+
+    def test_exact_match(self):
+        self.assertEqual(self.trie.resolve("example.nl"), "NL")
+        self.assertIsNone(self.trie.resolve("example.com"))
+        self.assertIsNone(self.trie.resolve("de"))
+
+    def test_most_specific_match(self):
+        self.assertEqual(self.trie.resolve("shop.example.nl"), "BE")
+        self.assertEqual(self.trie.resolve("www.example.nl"), "NL")
+        self.assertEqual(self.trie.resolve("a.shop.example.nl"), "NL")
+
+
+class CountryCodeForHostTests(CountrySiteTestCase):
+
+    def test_country_site_domains(self):
+        self.assertEqual(get_country_code_for_host("example.nl"), "NL")
+        self.assertEqual(get_country_code_for_host("www.example.nl:8000"), "NL")
+        self.assertEqual(get_country_code_for_host("EXAMPLE.DE"), "DE")
+
+    def test_shared_domain(self):
+        self.assertIsNone(get_country_code_for_host("example.com"))
+        self.assertIsNone(get_country_code_for_host("www.example.com"))
+
+    @override_settings(GENERIC_DOMAINS=["example.nl"])
+    def test_generic_domain(self):
+        self.assertIsNone(get_country_code_for_host("example.nl"))
+
+    @override_settings(UNIQUE_DOMAINS={"example.com": "us", "*.example.de": "nl"})
+    def test_unique_domains(self):
+        self.assertEqual(get_country_code_for_host("example.com"), "US")
+        self.assertEqual(get_country_code_for_host("shop.example.de"), "NL")
+        self.assertEqual(get_country_code_for_host("example.de"), "DE")
+
+    @override_settings(UNIQUE_DOMAINS={"localhost:8001": "de", "localhost:8002": "nl"})
+    def test_unique_domains_with_port(self):
+        self.assertEqual(get_country_code_for_host("localhost:8001"), "DE")
+        self.assertEqual(get_country_code_for_host("localhost:8002"), "NL")
+        self.assertIsNone(get_country_code_for_host("localhost:8003"))
+        self.assertIsNone(get_country_code_for_host("localhost"))
+
+    def test_inactive_and_changed_sites(self):
+        CountrySite.objects.filter(country_code="NL").update(active=False)
+        CountrySite.objects.clear_cache()
+        self.assertIsNone(get_country_code_for_host("example.nl"))
+
+        site = CountrySite.objects.get(country_code="DE")
+        site.domain = "example.at"
+        site.save()
+        self.assertEqual(get_country_code_for_host("example.at"), "DE")
+        self.assertIsNone(get_country_code_for_host("example.de"))
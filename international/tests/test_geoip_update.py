@@ -0,0 +1,119 @@
+import hashlib
+import io
+import os
+import pathlib
+import tarfile
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from international.localize import GEOIP_GENERATION_FILE
+
+
+class CheckAndUpdateGeoIP2Tests(SimpleTestCase):
+    """
+    Install from a local mirror (file:// url), without network access
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        self.geoip_path = os.path.join(directory.name, "geoip")
+        self.mirror = os.path.join(directory.name, "mirror")
+        os.makedirs(self.mirror)
+        self.archive = os.path.join(self.mirror, "GeoLite2-Country.tar.gz")
+        self.url = pathlib.Path(self.archive).as_uri()
+
+        settings = override_settings(GEOIP_PATH=self.geoip_path, GEOIP_DOWNLOAD_URL=self.url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def publish(self, database=b"database 1", name="GeoLite2-Country_20260101", checksum=None):
+        with tarfile.open(self.archive, "w:gz") as tar:
+            member = tarfile.TarInfo("{0}/GeoLite2-Country.mmdb".format(name))
+            member.size = len(database)
+            tar.addfile(member, io.BytesIO(database))
+
+        with open(self.archive, "rb") as f:
+            digest = checksum or hashlib.sha256(f.read()).hexdigest()
+        with open(self.archive + ".sha256", "w") as f:
+            f.write("{0}  {1}.tar.gz\n".format(digest, name))
+
+    def update(self, **options):
+        stdout = io.StringIO()
+        call_command("check_and_update_geoip2", stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def read(self, name):
+        with open(os.path.join(self.geoip_path, name), "rb") as f:
+            return f.read()
+
+    def test_install(self):
+        self.publish()
+        self.update()
+
+        self.assertEqual(self.read("GeoLite2-Country.mmdb"), b"database 1")
+        self.assertTrue(self.read(GEOIP_GENERATION_FILE).startswith(b"GeoLite2-Country_20260101.tar.gz "))
+        self.assertEqual(sorted(os.listdir(self.geoip_path)), [GEOIP_GENERATION_FILE, "GeoLite2-Country.mmdb"])
+
+    def test_up_to_date(self):
+        self.publish()
+        self.update()
+        generation = self.read(GEOIP_GENERATION_FILE)
+
+        self.assertIn("latest version", self.update())
+        self.assertEqual(self.read(GEOIP_GENERATION_FILE), generation)
+
+    def test_update(self):
+        self.publish()
+        self.update()
+        self.publish(database=b"database 2", name="GeoLite2-Country_20260201")
+        self.update()
+
+        self.assertEqual(self.read("GeoLite2-Country.mmdb"), b"database 2")
+        self.assertTrue(self.read(GEOIP_GENERATION_FILE).startswith(b"GeoLite2-Country_20260201.tar.gz "))
+
+    def test_force(self):
+        self.publish()
+        self.update()
+        self.assertIn("Successfully installed", self.update(force=True))
+
+    def test_checksum_mismatch(self):
+        self.publish()
+        self.update()
+        self.publish(database=b"tampered", name="GeoLite2-Country_20260201", checksum="0" * 64)
+
+        with self.assertRaisesMessage(CommandError, "Checksum mismatch"):
+            self.update()
+
+        # The installed database is kept and no temporary files are left
+        self.assertEqual(self.read("GeoLite2-Country.mmdb"), b"database 1")
+        self.assertEqual(sorted(os.listdir(self.geoip_path)), [GEOIP_GENERATION_FILE, "GeoLite2-Country.mmdb"])
+
+    def test_invalid_checksum_file(self):
+        self.publish()
+        with open(self.archive + ".sha256", "w") as f:
+            f.write("not a checksum")
+
+        with self.assertRaisesMessage(CommandError, "Invalid checksum file"):
+            self.update()
+
+    def test_no_database_in_archive(self):
+        with tarfile.open(self.archive, "w:gz") as tar:
+            member = tarfile.TarInfo("GeoLite2-Country_20260101/README.txt")
+            tar.addfile(member, io.BytesIO())
+        with open(self.archive, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with open(self.archive + ".sha256", "w") as f:
+            f.write(digest)
+
+        with self.assertRaisesMessage(CommandError, "No .mmdb database"):
+            self.update()
+        self.assertFalse(os.path.exists(os.path.join(self.geoip_path, "GeoLite2-Country.mmdb")))
+
+    def test_local_path(self):
+        self.publish()
+        self.update(url=self.archive)
+        self.assertEqual(self.read("GeoLite2-Country.mmdb"), b"database 1")
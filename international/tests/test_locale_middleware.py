@@ -0,0 +1,61 @@
+from django.test import override_settings
+
+from international.models import CountrySite
+
+from .utils import CountrySiteTestCase
+
+
+@override_settings(MIDDLEWARE=[
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "international.middleware.InternationalLocaleMiddleware",
+])
+class InternationalLocaleMiddlewareTests(CountrySiteTestCase):
+
+    def get_language(self, host="example.de", **extra):
+        response = self.client.get("/language/", HTTP_HOST=host, **extra)
+        self.assertEqual(response["Content-Language"], response.content.decode())
+        return response.content.decode()
+
+    def test_accept_language(self):
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="en-US,en;q=0.9"), "en")
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="fr,nl;q=0.5"), "nl")
+
+    def test_vary(self):
+        response = self.client.get("/language/", HTTP_HOST="example.de")
+        self.assertIn("Accept-Language", response["Vary"])
+
+    def test_language_cookie(self):
+        self.client.cookies["django_language"] = "nl"
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="en"), "nl")
+
+    def test_country_site_default_language(self):
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="fr"), "de")
+        self.assertEqual(self.get_language("example.nl", HTTP_ACCEPT_LANGUAGE="fr"), "nl")
+
+    @override_settings(COUNTRY_LANGUAGES={"DE": ["de", "en"]})
+    def test_country_languages(self):
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="nl,en;q=0.5"), "en")
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="nl"), "de")
+
+        self.client.cookies["django_language"] = "nl"
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="nl"), "de")
+
+    @override_settings(COUNTRY_LANGUAGES={"DE": ["en-us", "nl"]})
+    def test_country_languages_normalized(self):
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="en-US"), "en")
+        # Not the disallowed site default language or LANGUAGE_CODE
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="fr"), "en")
+
+    @override_settings(FORCE_COUNTRY_LANGUAGE=True)
+    def test_force_country_language(self):
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="en"), "de")
+        self.client.cookies["django_language"] = "en"
+        self.assertEqual(self.get_language("example.nl"), "nl")
+
+    @override_settings(FORCE_COUNTRY_LANGUAGE=True, LANGUAGE_CODE="nl", LANGUAGES=[("en", "English")])
+    def test_force_country_language_variant(self):
+        CountrySite.objects.filter(country_code="DE").update(default_language="en-us")
+        CountrySite.objects.clear_cache()
+
+        # Like LocaleMiddleware with InternationalSiteMiddleware
+        self.assertEqual(self.get_language(HTTP_ACCEPT_LANGUAGE="nl"), "en-us")
@@ -0,0 +1,91 @@
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from international.localize import (
+    NetworkMatcher, get_country_from_header, visitor_ip_address,
+)
+
+
+class NetworkMatcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.matcher = NetworkMatcher(["10.0.0.0/8", "10.1.0.0/16", "192.168.1.0/24", "::1/128", "2001:db8::/32"])
+
+    def test_ipv4(self):
+        self.assertIn("10.0.0.0", self.matcher)
+        self.assertIn("10.255.255.255", self.matcher)
+        self.assertIn("192.168.1.255", self.matcher)
+        self.assertNotIn("11.0.0.0", self.matcher)
+        self.assertNotIn("192.168.2.0", self.matcher)
+
+    def test_ipv6(self):
+        self.assertIn("::1", self.matcher)
+        self.assertIn("2001:db8:ffff::1", self.matcher)
+        self.assertNotIn("2001:db9::", self.matcher)
+
+    def test_ipv4_mapped(self):
+        self.assertIn("::ffff:10.0.0.1", self.matcher)
+        self.assertNotIn("::ffff:11.0.0.1", self.matcher)
+
+    def test_invalid(self):
+        self.assertNotIn("", self.matcher)
+        self.assertNotIn("unknown", self.matcher)
+        self.assertNotIn(None, self.matcher)
+
+    def test_empty(self):
+        self.assertFalse(NetworkMatcher([]))
+        self.assertTrue(self.matcher)
+
+
+@override_settings(TRUSTED_PROXIES=["10.0.0.0/8"], COUNTRY_HEADERS=["HTTP_CF_IPCOUNTRY"])
+class TrustedProxyTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_header_from_trusted_proxy(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_CF_IPCOUNTRY="de")
+        self.assertEqual(get_country_from_header(request), "DE")
+
+    def test_header_ignored_from_untrusted_address(self):
+        request = self.factory.get("/", REMOTE_ADDR="8.8.8.8", HTTP_CF_IPCOUNTRY="DE")
+        self.assertIsNone(get_country_from_header(request))
+
+    @override_settings(TRUSTED_PROXIES=[])
+    def test_header_ignored_without_trusted_proxies(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_CF_IPCOUNTRY="DE")
+        self.assertIsNone(get_country_from_header(request))
+
+    def test_header_unknown_country(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_CF_IPCOUNTRY="XX")
+        self.assertIsNone(get_country_from_header(request))
+
+    def test_header_country_alias(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_CF_IPCOUNTRY="GB")
+        self.assertEqual(get_country_from_header(request), "UK")
+
+    def test_header_from_ipv4_mapped_trusted_proxy(self):
+        request = self.factory.get("/", REMOTE_ADDR="::ffff:10.0.0.1", HTTP_CF_IPCOUNTRY="DE")
+        self.assertEqual(get_country_from_header(request), "DE")
+
+    def test_last_untrusted_hop(self):
+        request = self.factory.get(
+            "/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="6.6.6.6, 1.2.3.4, 10.0.0.2",
+        )
+        self.assertEqual(visitor_ip_address(request), "1.2.3.4")
+
+    def test_forwarded_for_from_ipv4_mapped_trusted_proxy(self):
+        request = self.factory.get("/", REMOTE_ADDR="::ffff:10.0.0.1", HTTP_X_FORWARDED_FOR="1.2.3.4")
+        self.assertEqual(visitor_ip_address(request), "1.2.3.4")
+
+    def test_forwarded_for_ignored_from_untrusted_address(self):
+        request = self.factory.get("/", REMOTE_ADDR="8.8.8.8", HTTP_X_FORWARDED_FOR="1.2.3.4")
+        self.assertEqual(visitor_ip_address(request), "8.8.8.8")
+
+    def test_only_trusted_hops(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="10.0.0.3, 10.0.0.2")
+        self.assertEqual(visitor_ip_address(request), "10.0.0.3")
+
+    @override_settings(TRUSTED_PROXIES=[])
+    def test_first_hop_without_trusted_proxies(self):
+        request = self.factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="1.2.3.4, 5.6.7.8")
+        self.assertEqual(visitor_ip_address(request), "1.2.3.4")
@@ -0,0 +1,110 @@
+from django.test import RequestFactory, override_settings
+from django.utils import translation
+from django.utils.functional import SimpleLazyObject
+
+from international.current import get_current_country_site
+from international.middleware import (
+    InternationalSiteMiddleware, compile_path_matcher, get_excluded_paths, is_country_site_resolved,
+)
+
+from .utils import CountrySiteTestCase
+
+
+class InternationalSiteMiddlewareTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+
+    def process(self, request, use_country_site=True):
+        def get_response(request):
+            if use_country_site:
+                str(request.country_site)
+            return self.client_response
+
+        from django.http import HttpResponse
+        self.client_response = HttpResponse()
+        return InternationalSiteMiddleware(get_response)(request)
+
+    def test_lazy_country_site(self):
+        request = self.factory.get("/page/", HTTP_HOST="example.de")
+        with self.assertNumQueries(0):
+            response = self.process(request, use_country_site=False)
+
+        self.assertIsInstance(request.country_site, SimpleLazyObject)
+        self.assertFalse(is_country_site_resolved(request))
+        self.assertNotIn("local", response.cookies)
+
+    def test_resolved_country_site(self):
+        request = self.factory.get("/page/", HTTP_HOST="example.de")
+        response = self.process(request)
+
+        self.assertTrue(is_country_site_resolved(request))
+        self.assertEqual(request.country_site.country_code, "DE")
+        self.assertEqual(request.country_site_source, "domain")
+        self.assertEqual(response.cookies["local"].value, "DE")
+
+    def test_local_cookie_unchanged(self):
+        request = self.factory.get("/page/", HTTP_HOST="example.de", HTTP_COOKIE="local=DE; local_dc=DE")
+        self.assertEqual(dict(self.process(request).cookies), {})
+
+    def test_current_country_site_reset(self):
+        self.process(self.factory.get("/page/", HTTP_HOST="example.de"))
+        self.assertIsNone(get_current_country_site())
+
+    def test_excluded_path(self):
+        request = self.factory.get("/static/site.css", HTTP_HOST="example.de")
+        response = self.process(request, use_country_site=False)
+
+        self.assertFalse(hasattr(request, "country_site"))
+        self.assertFalse(is_country_site_resolved(request))
+        self.assertEqual(dict(response.cookies), {})
+
+    def test_not_resolved_without_request_attribute(self):
+        self.assertFalse(is_country_site_resolved(self.factory.get("/")))
+
+
+class ExcludedPathsTests(CountrySiteTestCase):
+
+    def test_default(self):
+        self.assertEqual(get_excluded_paths(), ["/static/", "/media/", "/favicon.ico"])
+
+    @override_settings(MEDIA_URL="")
+    def test_empty_media_url(self):
+        paths = get_excluded_paths()
+        self.assertNotIn("/", paths)
+        self.assertFalse(compile_path_matcher(paths)("/page/"))
+
+    @override_settings(INTERNATIONAL_EXCLUDE_PATHS=["/assets/", r"^/health/?$", "relative/", ""])
+    def test_setting(self):
+        self.assertEqual(get_excluded_paths(), ["/assets/", r"^/health/?$"])
+
+    def test_path_matcher(self):
+        matches = compile_path_matcher(["/static/", r"^/api/v\d+/", r"^/health/?$"])
+        self.assertTrue(matches("/static/site.css"))
+        self.assertTrue(matches("/api/v1/products"))
+        self.assertTrue(matches("/health"))
+        self.assertFalse(matches("/healthy"))
+        self.assertFalse(matches("/page/"))
+        self.assertFalse(compile_path_matcher([])("/page/"))
+
+
+@override_settings(
+    MIDDLEWARE=[
+        "django.contrib.sessions.middleware.SessionMiddleware",
+        "international.middleware.InternationalLocaleMiddleware",
+    ],
+    INTERNATIONAL_EXCLUDE_PATHS=[r"^/localize/batch/"],
+    LOCALIZE_BATCH_NETWORKS=["127.0.0.1/32"],
+)
+class ExcludedPathLanguageTests(CountrySiteTestCase):
+
+    def test_language_negotiated(self):
+        self.client.get("/localize/", HTTP_ACCEPT_LANGUAGE="de")
+        self.assertEqual(translation.get_language(), "de")
+
+        response = self.client.get("/localize/batch/?ip=1.1.1.1", HTTP_ACCEPT_LANGUAGE="nl")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Language"], "nl")
+        self.assertEqual(translation.get_language(), "nl")
+        self.assertNotIn("local", response.cookies)
@@ -0,0 +1,102 @@
+import time
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import override_settings
+
+from international import models, preload
+from international.models import CountrySite
+
+from .utils import CountrySiteTestCase
+
+
+class WarmUpTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.multiple(preload, _PRELOADED_AT=None, _CHECK_PENDING=False, _FORK_HOOK_REGISTERED=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_country_sites(self):
+        with self.assertLogs("international.preload", "INFO") as logs:
+            loaded = preload.warm_up()
+
+        self.assertEqual(loaded, ["crawler matcher", "4 country sites"])
+        self.assertIn("Preloaded crawler matcher, 4 country sites in", logs.output[0])
+        self.assertIsNotNone(preload._PRELOADED_AT)
+
+        with self.assertNumQueries(0):
+            CountrySite.objects.get_current(country_code="DE")
+
+    def test_database_error(self):
+        with mock.patch.object(CountrySite.objects, "prime_cache", side_effect=DatabaseError("no such table")):
+            with self.assertLogs("international.preload", "INFO") as logs:
+                loaded = preload.warm_up()
+
+        self.assertEqual(loaded, ["crawler matcher"])
+        self.assertIn("Could not preload country sites: no such table", logs.output[0])
+        self.assertNotIn("country sites", logs.output[1])
+        self.assertEqual(models.COUNTRY_SITE_CACHE, {})
+
+    @override_settings(GEOIP_PATH="/tmp/geoip")
+    def test_geoip(self):
+        with mock.patch("international.localize.get_geoip") as get_geoip:
+            loaded = preload.warm_up()
+
+        get_geoip.assert_called_once_with()
+        self.assertEqual(loaded, ["crawler matcher", "4 country sites", "GeoIP database"])
+
+    @override_settings(GEOIP_PATH="/tmp/geoip")
+    def test_geoip_error(self):
+        with mock.patch("international.localize.get_geoip", side_effect=FileNotFoundError("GeoLite2-Country.mmdb")):
+            with self.assertLogs("international.preload", "INFO") as logs:
+                loaded = preload.warm_up()
+
+        self.assertNotIn("GeoIP database", loaded)
+        self.assertIn("Could not preload GeoIP database", logs.output[0])
+        self.assertNotIn("GeoIP", logs.output[1])
+
+    def test_fork_hook_registered_once(self):
+        with mock.patch.object(preload, "_FORK_HOOK_REGISTERED", False), \
+                mock.patch("os.register_at_fork", create=True) as register_at_fork:
+            preload.warm_up()
+            preload.warm_up()
+            self.assertTrue(preload._FORK_HOOK_REGISTERED)
+
+        register_at_fork.assert_called_once_with(after_in_child=preload._after_fork)
+
+
+class PreloadFreshnessTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.multiple(preload, _PRELOADED_AT=time.monotonic(), _CHECK_PENDING=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        CountrySite.objects.prime_cache()
+
+    def test_not_forked(self):
+        preload.check_preload_freshness()
+        self.assertNotEqual(models.COUNTRY_SITE_CACHE, {})
+
+    @mock.patch("international.localize.recheck_geoip_generation")
+    def test_fresh(self, recheck_geoip_generation):
+        preload._after_fork()
+        preload.check_preload_freshness()
+
+        self.assertNotEqual(models.COUNTRY_SITE_CACHE, {})
+        recheck_geoip_generation.assert_called_once_with()
+
+        preload.check_preload_freshness()
+        recheck_geoip_generation.assert_called_once_with()
+
+    @override_settings(INTERNATIONAL_PRELOAD_MAX_AGE=60)
+    @mock.patch("international.localize.recheck_geoip_generation")
+    def test_stale(self, recheck_geoip_generation):
+        preload._PRELOADED_AT -= 120
+        preload._after_fork()
+        preload.check_preload_freshness()
+
+        self.assertEqual(models.COUNTRY_SITE_CACHE, {})
+        recheck_geoip_generation.assert_called_once_with()
@@ -0,0 +1,153 @@
+import hashlib
+import io
+import ipaddress
+import os
+import pathlib
+import tarfile
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from international import localize
+from international.localize import RangeTable
+
+
+class FakeReader:
+    """
+    Stand-in for a maxminddb reader iterating over (network, record)
+    """
+
+    def __init__(self, networks):
+        self.networks = networks
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        for network, country_code in self.networks:
+            yield ipaddress.ip_network(network), {"country": {"iso_code": country_code}}
+
+
+class RangeTableTests(SimpleTestCase):
+
+    networks = [
+        ("1.0.0.0/24", "NL"),
+        ("1.0.1.0/24", "NL"),
+        ("1.0.2.0/23", "DE"),
+        ("255.255.255.0/24", "US"),
+        ("2a00::/16", "GB"),
+        ("2a01:4f8::/32", "DE"),
+        # IPv4 aliases in IPv6 space are looked up as IPv4
+        ("::ffff:5.0.0.0/104", "FR"),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "test.ranges")
+
+        with mock.patch("maxminddb.open_database", return_value=FakeReader(self.networks)):
+            self.counts = RangeTable.compile("test.mmdb", self.path)
+        self.table = RangeTable(self.path)
+
+    def test_merged_ranges(self):
+        self.assertEqual(self.counts, (3, 2))
+
+    def test_ipv4_range_edges(self):
+        self.assertIsNone(self.table.lookup("0.255.255.255"))
+        self.assertEqual(self.table.lookup("1.0.0.0"), "NL")
+        self.assertEqual(self.table.lookup("1.0.1.255"), "NL")
+        self.assertEqual(self.table.lookup("1.0.2.0"), "DE")
+        self.assertEqual(self.table.lookup("1.0.3.255"), "DE")
+        self.assertIsNone(self.table.lookup("1.0.4.0"))
+        self.assertEqual(self.table.lookup("255.255.255.255"), "US")
+
+    def test_ipv6(self):
+        self.assertEqual(self.table.lookup("2a00::"), "GB")
+        self.assertEqual(self.table.lookup("2a00:ffff:ffff:ffff:ffff:ffff:ffff:ffff"), "GB")
+        self.assertEqual(self.table.lookup("2a01:4f8::1"), "DE")
+        self.assertIsNone(self.table.lookup("2a01:4f9::"))
+        self.assertIsNone(self.table.lookup("::2"))
+
+    def test_ipv4_in_ipv6(self):
+        self.assertEqual(self.table.lookup("::ffff:1.0.0.1"), "NL")
+        self.assertEqual(self.table.lookup("2002:100:201::"), "DE")
+        self.assertIsNone(self.table.lookup("::ffff:5.0.0.1"))
+
+    def test_invalid(self):
+        self.assertIsNone(self.table.lookup("unknown"))
+        self.assertIsNone(self.table.lookup(""))
+
+    def test_lookup_many(self):
+        self.assertEqual(
+            self.table.lookup_many(["1.0.0.1", "2a00::1", "unknown", "8.8.8.8"]),
+            ["NL", "GB", None, None],
+        )
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a table" + bytes(20))
+        with self.assertRaises(ValueError):
+            RangeTable(self.path)
+
+
+@override_settings(GEOIP_ENGINE="rangetable")
+class RangeTableEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        localize._READERS.clear()
+        self.addCleanup(localize._READERS.clear)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.geoip_path = directory.name
+
+    def test_lookup(self):
+        with mock.patch("maxminddb.open_database", return_value=FakeReader(RangeTableTests.networks)):
+            RangeTable.compile("test.mmdb", os.path.join(self.geoip_path, localize.RANGE_TABLE_FILE))
+
+        with override_settings(GEOIP_PATH=self.geoip_path):
+            self.assertEqual(localize.get_country_from_ip_address("1.0.0.1"), "NL")
+            # Country code aliases apply to the range table too
+            self.assertEqual(localize.get_country_from_ip_address("2a00::1"), "UK")
+            self.assertEqual(
+                localize.get_countries_from_ip_addresses(["1.0.2.1", "8.8.8.8"]),
+                {"1.0.2.1": "DE", "8.8.8.8": None},
+            )
+
+    def test_missing_table(self):
+        with override_settings(GEOIP_PATH=os.path.join(self.geoip_path, "missing")):
+            self.assertIsNone(localize.get_country_from_ip_address("1.0.0.1"))
+            self.assertEqual(localize.get_countries_from_ip_addresses(["1.0.0.1"]), {"1.0.0.1": None})
+
+    def test_corrupt_table(self):
+        with open(os.path.join(self.geoip_path, localize.RANGE_TABLE_FILE), "wb") as f:
+            f.write(bytes(64))
+
+        with override_settings(GEOIP_PATH=self.geoip_path):
+            self.assertIsNone(localize.get_country_from_ip_address("1.0.0.1"))
+
+    def test_compile_when_missing_and_database_up_to_date(self):
+        archive = os.path.join(self.geoip_path, "GeoLite2-Country.tar.gz")
+        with tarfile.open(archive, "w:gz") as tar:
+            member = tarfile.TarInfo("GeoLite2-Country_20260101/GeoLite2-Country.mmdb")
+            member.size = 8
+            tar.addfile(member, io.BytesIO(b"database"))
+        with open(archive, "rb") as f, open(archive + ".sha256", "w") as checksum:
+            checksum.write(hashlib.sha256(f.read()).hexdigest())
+
+        geoip_path = os.path.join(self.geoip_path, "geoip")
+        with override_settings(GEOIP_PATH=geoip_path, GEOIP_DOWNLOAD_URL=pathlib.Path(archive).as_uri()):
+            with override_settings(GEOIP_ENGINE="geoip2"):
+                call_command("check_and_update_geoip2", stdout=io.StringIO())
+
+            with mock.patch.object(RangeTable, "compile") as compile:
+                call_command("check_and_update_geoip2", stdout=io.StringIO())
+            compile.assert_called_once_with(
+                os.path.join(geoip_path, "GeoLite2-Country.mmdb"), localize.get_range_table_path(),
+            )
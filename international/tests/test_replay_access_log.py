@@ -0,0 +1,89 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+
+from international import localize
+from international.localize import RANGE_TABLE_FILE, RangeTable
+
+from .test_range_table import FakeReader
+from .utils import CountrySiteTestCase
+
+LOG = """\
+1.0.0.1 - - [19/Oct/2026:10:00:00 +0000] "GET /page/?c=DE HTTP/1.1" 200 12
+example.nl 1.0.0.1 - - [19/Oct/2026:10:00:01 +0000] "GET /page/ HTTP/1.1" 200 12 "-" "Mozilla/5.0"
+1.0.0.1 - - [19/Oct/2026:10:00:02 +0000] "GET /static/site.css HTTP/1.1" 200 12
+1.0.0.1 - - [19/Oct/2026:10:00:03 +0000] "GET /page/ HTTP/1.1" 200 12 "-" "Mozilla/5.0" "local=DE"
+not a log line
+"""
+
+
+class ReplayAccessLogTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        self.logfile = os.path.join(self.directory, "access.log")
+        with open(self.logfile, "w") as f:
+            f.write(LOG)
+
+    def replay(self, *args, **options):
+        stdout = io.StringIO()
+        call_command("replay_access_log", self.logfile, *args, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def sources(self, output):
+        lines = output.split("Resolution source:\n")[1].split("GeoIP lookups")[0].splitlines()
+        return {line.split()[0]: int(line.split()[1]) for line in lines}
+
+    def test_sources(self):
+        output = self.replay(host="example.com")
+        self.assertIn("Replayed 4 requests", output)
+        self.assertIn("1 lines skipped", output)
+        self.assertEqual(self.sources(output), {"param": 1, "domain": 1, "excluded": 1, "cookie": 1})
+        self.assertIn("GeoIP lookups per 1k requests: 0.0", output)
+
+    @override_settings(FORCE_COUNTRY_LANGUAGE=True)
+    def test_force_country_language(self):
+        self.assertEqual(
+            self.sources(self.replay(host="example.com")),
+            {"param": 1, "domain": 1, "excluded": 1, "cookie": 1},
+        )
+
+    def test_locale_middleware(self):
+        output = self.replay(host="example.com", middleware="international.middleware.InternationalLocaleMiddleware")
+        self.assertEqual(self.sources(output), {"param": 1, "domain": 1, "excluded": 1, "cookie": 1})
+
+    def test_limit(self):
+        self.assertIn("Replayed 2 requests", self.replay(limit=2))
+
+    @override_settings(GEOIP_ENGINE="rangetable", GEOIP_REDIRECT=True)
+    def test_geoip_lookups(self):
+        localize._READERS.clear()
+        self.addCleanup(localize._READERS.clear)
+        with mock.patch("maxminddb.open_database", return_value=FakeReader([("1.0.0.0/24", "DE")])):
+            RangeTable.compile("test.mmdb", os.path.join(self.directory, RANGE_TABLE_FILE))
+
+        with override_settings(GEOIP_PATH=self.directory):
+            output = self.replay(host="example.com")
+        self.assertEqual(self.sources(output), {"param": 1, "domain": 1, "excluded": 1, "cookie": 1})
+
+        # Only the request without url parameter, domain or cookie
+        with open(self.logfile, "w") as f:
+            f.write(LOG.splitlines()[0].replace("?c=DE", "") + "\n")
+        with override_settings(GEOIP_PATH=self.directory):
+            output = self.replay(host="example.com")
+        self.assertEqual(self.sources(output), {"geoip": 1})
+        self.assertIn("GeoIP lookups per 1k requests: 1000.0", output)
+
+    def test_no_requests(self):
+        with open(self.logfile, "w") as f:
+            f.write("not a log line\n")
+        with self.assertRaisesMessage(CommandError, "No requests found"):
+            self.replay()
@@ -0,0 +1,79 @@
+from django.test import TestCase, override_settings
+
+from international.current import reset_current_country_site, set_current_country_site
+from international import models
+from international.models import CountrySite
+
+from .testapp.models import Product
+
+
+@override_settings(
+    DATABASE_ROUTERS=["international.routers.CountrySiteRouter"],
+    INTERNATIONAL_DATABASES={"NL": "eu"},
+    COUNTRY_SITE_DATABASE="default",
+)
+class CountrySiteRouterTests(TestCase):
+    databases = {"default", "eu"}
+
+    @classmethod
+    def setUpTestData(cls):
+        # Country sites are replicated to every database
+        for using, name in (("default", "Netherlands"), ("eu", "Nederland")):
+            CountrySite.objects.using(using).create(country_code="NL", domain="example.nl", name=name, default_language="nl")
+            CountrySite.objects.using(using).create(country_code="DE", domain="example.de", name="DE", default_language="de")
+
+    def setUp(self):
+        CountrySite.objects.clear_cache()
+        self.addCleanup(CountrySite.objects.clear_cache)
+
+    def set_current(self, country_code):
+        token = set_current_country_site(CountrySite.objects.get_current(country_code=country_code))
+        self.addCleanup(reset_current_country_site, token)
+
+    def test_reads_routed_by_current_country_site(self):
+        Product.objects.using("eu").create(name="eu")
+        Product.objects.using("default").create(name="default")
+
+        self.set_current("NL")
+        self.assertEqual([p.name for p in Product.objects.all()], ["eu"])
+
+    def test_reads_not_routed_for_other_countries(self):
+        Product.objects.using("eu").create(name="eu")
+        Product.objects.using("default").create(name="default")
+
+        self.set_current("DE")
+        self.assertEqual([p.name for p in Product.objects.all()], ["default"])
+
+    def test_writes_not_routed_by_default(self):
+        self.set_current("NL")
+        self.assertEqual(Product.objects.create(name="p")._state.db, "default")
+
+    @override_settings(INTERNATIONAL_ROUTE_WRITES=True)
+    def test_writes_routed(self):
+        self.set_current("NL")
+        self.assertEqual(Product.objects.create(name="p")._state.db, "eu")
+
+    def test_country_sites_from_country_site_database(self):
+        self.set_current("NL")
+        self.assertEqual(CountrySite.objects.get(country_code="NL").name, "Netherlands")
+
+    def test_many_to_many_in_database_of_instance(self):
+        self.set_current("NL")
+        product = Product.objects.using("eu").create(name="p")
+        product.country_sites.add(CountrySite.objects.using("eu").get(country_code="NL"))
+
+        product = Product.objects.get(pk=product.pk)
+        self.assertEqual(product._state.db, "eu")
+        self.assertEqual([site.name for site in product.country_sites.all()], ["Nederland"])
+        self.assertEqual(list(Product.objects.by_country("NL")), [product])
+
+    def test_cache_per_database(self):
+        self.assertEqual(CountrySite.objects.get_current(country_code="NL").name, "Netherlands")
+        self.assertEqual(CountrySite.objects.db_manager("eu").get_current(country_code="NL").name, "Nederland")
+        self.assertEqual(set(models.COUNTRY_SITE_CACHE), {"default", "eu"})
+
+        site = CountrySite.objects.using("eu").get(country_code="NL")
+        site.name = "NL"
+        site.save(using="eu")
+        self.assertEqual(CountrySite.objects.db_manager("eu").get_current(country_code="NL").name, "NL")
+        self.assertEqual(CountrySite.objects.get_current(country_code="NL").name, "Netherlands")
@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.test import override_settings
+
+from international import models
+from international.models import CountrySite
+
+from .utils import CountrySiteTestCase
+
+SNAPSHOT_KEY = models.SHARED_CACHE_KEY % "default"
+
+
+@override_settings(COUNTRY_SITE_SHARED_CACHE="default")
+class SharedCacheTests(CountrySiteTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def new_process(self):
+        CountrySite.objects.clear_cache()
+
+    def test_snapshot(self):
+        with self.assertNumQueries(1):
+            CountrySite.objects.get_current(country_code="NL")
+        self.assertEqual({row[3] for row in cache.get(SNAPSHOT_KEY)["rows"]}, {"NL", "DE", "UK", "US"})
+
+        self.new_process()
+        with self.assertNumQueries(0):
+            self.assertEqual(CountrySite.objects.get_current(country_code="DE").domain, "example.de")
+            self.assertEqual(len(CountrySite.objects.get_active_sites()), 4)
+
+    def test_lock_held(self):
+        cache.add(SNAPSHOT_KEY + ".lock", True)
+
+        with mock.patch.object(models, "SHARED_CACHE_WAIT", 0.1), self.assertNumQueries(1):
+            CountrySite.objects.get_current(country_code="NL")
+        self.assertIsNone(cache.get(SNAPSHOT_KEY))
+
+    def test_lock_released(self):
+        CountrySite.objects.prime_cache()
+        self.assertIsNone(cache.get(SNAPSHOT_KEY + ".lock"))
+
+    def test_backend_failure(self):
+        with mock.patch.object(cache, "get_many", side_effect=ConnectionError("down")):
+            with self.assertLogs("international.models", "WARNING"), self.assertNumQueries(1):
+                site = CountrySite.objects.get_current(country_code="NL")
+        self.assertEqual(site.domain, "example.nl")
+
+    def test_miss_falls_back_to_database(self):
+        CountrySite.objects.prime_cache()
+        # Bulk created sites send no signals, so the snapshot isn't replaced
+        CountrySite.objects.bulk_create([
+            CountrySite(country_code="BE", domain="example.be", name="BE", default_language="nl"),
+        ])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(CountrySite.objects.get_current(country_code="BE").domain, "example.be")
+        with self.assertNumQueries(0):
+            CountrySite.objects.get_current(country_code="BE")
+
+        with self.assertNumQueries(1), self.assertRaises(CountrySite.DoesNotExist):
+            CountrySite.objects.get_current(country_code="FR")
+
+    def test_reload_changed_snapshot(self):
+        CountrySite.objects.prime_cache()
+
+        # Another process renames a country site
+        CountrySite.objects.filter(country_code="DE").update(country_code="AT", name="Austria")
+        models.clear_shared_cache(CountrySite, using="default")
+
+        with self.assertNumQueries(1):
+            self.assertEqual(CountrySite.objects.get_current(country_code="AT").name, "Austria")
+        with self.assertNumQueries(1), self.assertRaises(CountrySite.DoesNotExist):
+            CountrySite.objects.get_current(country_code="DE")
+
+    def test_failed_save(self):
+        site = CountrySite.objects.get_current(country_code="DE")
+        site.name = "Germany"
+
+        with mock.patch.object(CountrySite, "_save_table", side_effect=DatabaseError), \
+                self.assertRaises(DatabaseError), transaction.atomic():
+            site.save()
+
+        self.assertEqual(CountrySite.objects.get_current(country_code="DE").name, "DE")
+
+    def test_save_replaces_snapshot(self):
+        site = CountrySite.objects.get_current(country_code="DE")
+        generation = cache.get(SNAPSHOT_KEY + ".generation")
+
+        site.name = "Germany"
+        site.save()
+
+        self.assertNotEqual(cache.get(SNAPSHOT_KEY + ".generation"), generation)
+        self.assertIsNone(cache.get(SNAPSHOT_KEY))
+        self.assertEqual(CountrySite.objects.get_current(country_code="DE").name, "Germany")
+
+        self.new_process()
+        with self.assertNumQueries(0):
+            self.assertEqual(CountrySite.objects.get_current(country_code="DE").name, "Germany")
@@ -0,0 +1,130 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+
+from international.views import LOCAL_DC_UNDETECTED_COOKIE
+
+from .utils import CountrySiteTestCase
+
+
+class CountryFromRequestTests(CountrySiteTestCase):
+
+    def test_not_detected(self):
+        response = self.client.get("/localize/")
+        self.assertEqual(response.json(), {"country": None, "detected": False})
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+    @mock.patch("international.localize.get_country_from_ip_address", return_value="DE")
+    def test_detected_from_ip(self, get_country_from_ip_address):
+        response = self.client.get("/localize/", REMOTE_ADDR="1.2.3.4")
+        self.assertEqual(response.json(), {"country": "DE", "detected": True})
+        get_country_from_ip_address.assert_called_with("1.2.3.4")
+
+    def test_conditional_get(self):
+        self.client.cookies["local_dc"] = "DE"
+        etag = self.client.get("/localize/")["ETag"]
+        response = self.client.get("/localize/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch("international.localize.get_country_from_ip_address")
+    def test_detected_cookie(self, get_country_from_ip_address):
+        self.client.cookies["local_dc"] = "DE"
+        response = self.client.get("/localize/")
+        self.assertEqual(response.json(), {"country": "DE", "detected": True})
+        get_country_from_ip_address.assert_not_called()
+
+    def test_undetected_cookie(self):
+        self.client.cookies["local_dc"] = "NL"
+        self.client.cookies[LOCAL_DC_UNDETECTED_COOKIE] = "1"
+        response = self.client.get("/localize/")
+        self.assertEqual(response.json(), {"country": "NL", "detected": False})
+
+    @override_settings(TRUSTED_PROXIES=["10.0.0.0/8"], COUNTRY_HEADERS=["HTTP_CF_IPCOUNTRY"])
+    def test_trusted_header(self):
+        self.client.cookies["local_dc"] = "NL"
+        response = self.client.get("/localize/", REMOTE_ADDR="10.0.0.1", HTTP_CF_IPCOUNTRY="DE")
+        self.assertEqual(response.json(), {"country": "DE", "detected": True})
+        self.assertIn("Cf-Ipcountry", response["Vary"])
+
+    def test_post_not_allowed(self):
+        self.assertEqual(self.client.post("/localize/").status_code, 405)
+
+
+class LocalDetectedCookieTests(CountrySiteTestCase):
+
+    def test_fallback_marked_undetected(self):
+        response = self.client.get("/page/", HTTP_HOST="example.de")
+        self.assertEqual(response.cookies["local_dc"].value, "NL")
+        self.assertIn(LOCAL_DC_UNDETECTED_COOKIE, response.cookies)
+
+        self.client.cookies["local_dc"] = "NL"
+        self.client.cookies[LOCAL_DC_UNDETECTED_COOKIE] = "1"
+        self.assertEqual(self.client.get("/localize/").json(), {"country": "NL", "detected": False})
+
+    @mock.patch("international.localize.get_country_from_ip_address", return_value="DE")
+    def test_detected(self, get_country_from_ip_address):
+        response = self.client.get("/page/", HTTP_HOST="example.de")
+        self.assertEqual(response.cookies["local_dc"].value, "DE")
+        self.assertNotIn(LOCAL_DC_UNDETECTED_COOKIE, response.cookies)
+
+    def test_crawler_marked_undetected(self):
+        response = self.client.get("/page/", HTTP_HOST="example.de", HTTP_USER_AGENT="Googlebot/2.1")
+        self.assertEqual(response.cookies["local_dc"].value, "DE")
+        self.assertIn(LOCAL_DC_UNDETECTED_COOKIE, response.cookies)
+
+
+@override_settings(LOCALIZE_BATCH_NETWORKS=["10.0.0.0/8"])
+@mock.patch("international.localize.get_country_from_ip_address", lambda ip: {"1.1.1.1": "NL"}.get(ip))
+class CountriesFromIpsTests(CountrySiteTestCase):
+
+    def test_get(self):
+        response = self.client.get("/localize/batch/?ip=1.1.1.1&ip=2.2.2.2", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.json(), {"results": {
+            "1.1.1.1": {"country": "NL", "detected": True},
+            "2.2.2.2": {"country": None, "detected": False},
+        }})
+        self.assertIn("no-store", response["Cache-Control"])
+
+    def test_post(self):
+        response = self.client.post(
+            "/localize/batch/", json.dumps({"ips": ["1.1.1.1"]}), content_type="application/json",
+            REMOTE_ADDR="10.0.0.5",
+        )
+        self.assertEqual(response.json(), {"results": {"1.1.1.1": {"country": "NL", "detected": True}}})
+
+    def test_invalid_body(self):
+        response = self.client.post("/localize/batch/", "[", content_type="application/json", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/localize/batch/", json.dumps({"ips": [1]}), content_type="application/json", REMOTE_ADDR="10.0.0.5",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(LOCALIZE_BATCH_MAX_IPS=1)
+    def test_too_many(self):
+        response = self.client.get("/localize/batch/?ip=1.1.1.1&ip=2.2.2.2", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 400)
+
+    def test_forbidden_outside_networks(self):
+        response = self.client.get("/localize/batch/?ip=1.1.1.1", REMOTE_ADDR="8.8.8.8")
+        self.assertEqual(response.status_code, 403)
+
+    def test_forged_forwarded_for(self):
+        response = self.client.get("/localize/batch/?ip=1.1.1.1", REMOTE_ADDR="8.8.8.8", HTTP_X_FORWARDED_FOR="10.0.0.5")
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(TRUSTED_PROXIES=["10.0.0.1/32"])
+    def test_client_behind_trusted_proxy(self):
+        response = self.client.get("/localize/batch/?ip=1.1.1.1", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="8.8.8.8")
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get("/localize/batch/?ip=1.1.1.1", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="10.0.0.5")
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_user(self):
+        self.client.force_login(User.objects.create(username="staff", is_staff=True))
+        response = self.client.get("/localize/batch/?ip=1.1.1.1", REMOTE_ADDR="8.8.8.8")
+        self.assertEqual(response.status_code, 200)
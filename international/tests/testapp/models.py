@@ -0,0 +1,7 @@
+from django.db import models
+
+from international.models import InternationalModel
+
+
+class Product(InternationalModel):
+    name = models.CharField(max_length=50)
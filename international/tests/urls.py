@@ -0,0 +1,9 @@
+from django.http import HttpResponse
+from django.urls import include, path
+from django.utils import translation
+
+urlpatterns = [
+    path("", include("international.urls")),
+    path("page/", lambda request: HttpResponse(request.country_site.country_code)),
+    path("language/", lambda request: HttpResponse(translation.get_language())),
+]
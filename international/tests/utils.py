@@ -0,0 +1,26 @@
+from django.test import TestCase
+
+from international.models import CountrySite
+
+
+class CountrySiteTestCase(TestCase):
+    """
+    TestCase with country sites NL, DE and UK/US sharing example.com, and
+    empty country site caches for every test
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for country_code, domain, language in (
+            ("NL", "example.nl", "nl"),
+            ("DE", "example.de", "de"),
+            ("UK", "example.com", "en"),
+            ("US", "example.com", "en"),
+        ):
+            CountrySite.objects.create(
+                country_code=country_code, domain=domain, name=country_code, default_language=language,
+            )
+
+    def setUp(self):
+        CountrySite.objects.clear_cache()
+        self.addCleanup(CountrySite.objects.clear_cache)
@@ -7,4 +7,9 @@ urlpatterns = [
         views.get_country_from_request,
         name="get_country_from_request",
     ),
-]
\ No newline at end of file
+    path(
+        r"localize/batch/",
+        views.get_countries_from_ips,
+        name="get_countries_from_ips",
+    ),
+]
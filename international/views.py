@@ -1,9 +1,23 @@
-from django.shortcuts import render
-from django.http import JsonResponse
+import json
+
+from django.conf import settings
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, set_response_etag
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 
 from international import localize
 
+# Seconds browsers may cache the localize/ response
+LOCALIZE_MAX_AGE = 60 * 60
+
+# Maximum number of IP addresses in one localize/batch/ request
+LOCALIZE_BATCH_MAX_IPS = 1000
+
+# Cookie set by the middleware next to local_dc when local_dc holds a fallback
+# (DEFAULT_COUNTRY_CODE or the country site of a crawler) instead of a detected country
+LOCAL_DC_UNDETECTED_COOKIE = "local_dc_undetected"
+
 def get_country_data_from_request(request):
 	country = localize.get_country_from_ip(request)
 
@@ -12,8 +26,90 @@ def get_country_data_from_request(request):
 		"detected": True if country else False,
 	}
 
-	return data	
+	return data
+
+def _header_name(meta_key):
+	"""
+	Convert a request.META key (HTTP_CF_IPCOUNTRY) to a header name (Cf-Ipcountry)
+	"""
+	return meta_key[len("HTTP_"):].replace("_", "-").title() if meta_key.startswith("HTTP_") else meta_key
+
+def _is_batch_request_allowed(request):
+	user = getattr(request, "user", None)
+	if user is not None and user.is_active and user.is_staff:
+		return True
+
+	networks = getattr(settings, "LOCALIZE_BATCH_NETWORKS", ())
+	if not networks:
+		return False
+
+	# The client address behind the TRUSTED_PROXIES, X-Forwarded-For can be
+	# forged so without trusted proxies only the connecting address is used
+	if localize.get_trusted_proxies():
+		client_ip = localize.visitor_ip_address(request)
+	else:
+		client_ip = request.META.get("REMOTE_ADDR")
+
+	return localize.ip_in_networks(client_ip, networks)
 
 @require_http_methods(["GET"])
 def get_country_from_request(request):
-	return JsonResponse(get_country_data_from_request(request))
\ No newline at end of file
+	country = localize.get_country_from_header(request)
+
+	if country:
+		data = {"country": country, "detected": True}
+	elif localize.is_country_code(request.COOKIES.get("local_dc", "")):
+		# Previously detected country saved by the middleware, skip detection
+		data = {
+			"country": request.COOKIES["local_dc"],
+			"detected": LOCAL_DC_UNDETECTED_COOKIE not in request.COOKIES,
+		}
+	else:
+		data = get_country_data_from_request(request)
+
+	response = JsonResponse(data)
+
+	# The result depends on the visitor IP address, so only the browser may cache it
+	patch_cache_control(response, private=True, max_age=getattr(settings, "LOCALIZE_MAX_AGE", LOCALIZE_MAX_AGE))
+	patch_vary_headers(response, ["Cookie"] + [_header_name(h) for h in getattr(settings, "COUNTRY_HEADERS", ())])
+	set_response_etag(response)
+
+	return get_conditional_response(request, etag=response["ETag"], response=response)
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def get_countries_from_ips(request):
+	"""
+	Detect the countries of multiple IP addresses at once, either passed as
+	?ip=...&ip=... or as POST JSON body {"ips": [...]}. Only available for staff
+	users or clients in settings.LOCALIZE_BATCH_NETWORKS.
+	"""
+
+	if not _is_batch_request_allowed(request):
+		return HttpResponseForbidden()
+
+	if request.method == "POST":
+		try:
+			ips = json.loads(request.body).get("ips", [])
+		except (ValueError, AttributeError):
+			return HttpResponseBadRequest("Invalid JSON body")
+	else:
+		ips = request.GET.getlist("ip")
+
+	if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+		return HttpResponseBadRequest("Expected a list of IP addresses")
+
+	if len(ips) > getattr(settings, "LOCALIZE_BATCH_MAX_IPS", LOCALIZE_BATCH_MAX_IPS):
+		return HttpResponseBadRequest("Too many IP addresses")
+
+	countries = localize.get_countries_from_ip_addresses(set(ips))
+
+	response = JsonResponse({
+		"results": {
+			ip: {"country": country, "detected": True if country else False}
+			for ip, country in countries.items()
+		}
+	})
+	patch_cache_control(response, private=True, no_store=True)
+
+	return response
@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+import os
+import sys
+
+import django
+from django.conf import settings
+from django.test.utils import get_runner
+
+if __name__ == "__main__":
+    os.environ["DJANGO_SETTINGS_MODULE"] = "international.tests.settings"
+    django.setup()
+    TestRunner = get_runner(settings)
+    failures = TestRunner().run_tests(sys.argv[1:] or ["international"])
+    sys.exit(bool(failures))